@@ -0,0 +1,572 @@
+'''
+This program times the election scraper offline so that changes can be compared. Datagraph pages are served by a
+local stub server instead of the atlas. Pages recorded from the atlas with "python Benchmark.py record" are saved in
+the Benchmark Fixtures folder and served as they are, and any other (state, year) page is generated from the county
+index in the same format, so every function can be timed without a network connection. Synthetic pages do not have
+the markup of the atlas, so every run warns about the fixtures that have not been recorded yet and lists them in its
+results.
+
+Each stage (fetch, parse, DataFrame construction, classification, MapChart output and Excel output) is timed on its
+own, along with election_results, election_swings, every create_* function and the full Examples.py workload.
+Results are printed as JSON, or written to a file with --output, with the time in seconds of each benchmark. With
+--memory the peak memory in bytes is recorded as well, which slows every benchmark down.
+
+The import time of ElectionScraper is measured in a fresh interpreter against import_budget, and each common path
+(importing, county lookups, downloading, and MapChart and Excel output from cached tables) is run in its own
+interpreter to check that it only loads the heavy modules it needs.
+
+Before anything is timed, the fast, lxml and BeautifulSoup parsers are checked to return the same counties for every
+fixture page and for a page of edge cases, and counties spelled the way the atlas spells them are checked to get their
+expected FIPS codes and MapChart IDs. "python Benchmark.py check" runs only this check, along with a check of
+the retries and crawl checkpoints against faults injected by the stub server and a check that callers can change the
+DataFrames they are given without changing the tables kept in memory. The check command also fails if importing goes
+over import_budget or a path loads heavy modules it does not need.
+
+
+required modules: numpy, pandas, and the modules required by ElectionScraper.py
+'''
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import random
+import runpy
+import subprocess
+import sys
+import threading
+import time
+import tempfile
+import tracemalloc
+import pandas as pd
+import requests
+import ElectionScraper as es
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+fixture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Benchmark Fixtures")
+
+# representative pages recorded by "python Benchmark.py record": Texas has the most counties (254), Virginia has
+# independent cities sharing county names, and the others cover the renamed counties and older elections
+fixtures = [("Texas", 2016), ("Texas", 1968), ("Virginia", 2008), ("Virginia", 1984), ("Maryland", 2008), ("Missouri", 2008), \
+("Florida", 1992), ("Nevada", 1960), ("South Dakota", 2012), ("California", 2008), ("Michigan", 1984), ("Michigan", 1996), \
+("Georgia", 1964), ("Minnesota", 2016), ("DC", 2008)]
+
+# county names as the atlas spells them, in the order they appear on a state's page, with the FIPS code and MapChart
+# path ID each must be given (None for a county that is not in the county index, which gets a negative code). this
+# covers counties the atlas lists under an old name or another spelling, and counties and independent cities that
+# share a name, where the county comes first
+atlas_names = [("Florida", "Dade", 12086, "Miami_Dade__FL"), ("Florida", "Desoto", 12027, "DeSoto__FL"), \
+("Nevada", "Ormsby", 32510, "Carson_City__NV"), ("South Dakota", "Shannon", 46102, "Oglala_Lakota__SD"), \
+("Texas", "Dewitt", 48123, "DeWitt__TX"), ("DC", "District of Columbia", 11001, "Washington__DC"), \
+("Illinois", "La Salle", 17099, "La_Salle__IL"), ("Minnesota", "Lac Qui Parle", 27073, "Lac_qui_Parle__MN"), \
+("Maryland", "Baltimore", 24005, "Baltimore_County__MD"), ("Maryland", "Baltimore", 24510, "Baltimore_City__MD"), \
+("Missouri", "St. Louis", 29189, "St__Louis_Co___MO"), ("Missouri", "St. Louis", 29510, "St__Louis__MO"), \
+("Virginia", "Fairfax", 51059, "Fairfax_Co___VA"), ("Virginia", "Fairfax", 51600, "Fairfax__VA"), \
+("Virginia", "Richmond", 51159, "Richmond_Co___VA"), ("Virginia", "Richmond", 51760, "Richmond__VA"), \
+("Virginia", "Bedford", 51019, "Bedford_Co___VA"), ("Virginia", "Bedford", 51515, "Bedford__VA"), \
+("Ohio", "Nowhere", None, "Nowhere__OH")]
+
+# private method that returns a function of the election scraper that is not part of its public interface
+def private(name):
+	return getattr(es, name)
+	
+
+# returns the path of the fixture page for a state FIPS code and year
+def fixture_path(state_fips, year):
+	return os.path.join(fixture_dir, str(state_fips) + "_" + str(year) + ".html")
+	
+# returns the fixtures that have not been recorded, whose pages are generated by synthetic_page
+def synthetic_fixtures():
+	return [(state, year) for (state, year) in fixtures if not os.path.isfile(fixture_path(es.fips[state], year))]
+	
+# prints a warning if any fixture has not been recorded, since the parse timings and checks of synthetic pages never
+# see the markup of the atlas
+def warn_synthetic():
+	synthetic = synthetic_fixtures()
+	if len(synthetic) > 0:
+		print("Warning: " + str(len(synthetic)) + " of the " + str(len(fixtures)) + " fixture pages are synthetic (" \
+		+ ", ".join([state + " " + str(year) for (state, year) in synthetic]) + "). Run \"python Benchmark.py record\" where the atlas " \
+		+ "can be reached and commit the Benchmark Fixtures folder", file=sys.stderr)
+		
+# downloads the fixture pages that have not been recorded yet from the atlas. a page that cannot be downloaded is
+# reported and left synthetic, so record can be run again to finish
+def record():
+	os.makedirs(fixture_dir, exist_ok=True)
+	for (state, year) in synthetic_fixtures():
+		try:
+			request = requests.get("https://uselectionatlas.org/RESULTS/datagraph.php?year=" + str(year) + "&fips=" + str(es.fips[state]), timeout=30)
+			request.raise_for_status()
+		except requests.RequestException as e:
+			print("Could not record " + state + " " + str(year) + ": " + str(e), file=sys.stderr)
+			continue
+		with open(fixture_path(es.fips[state], year), "wb") as f:
+			f.write(request.content)
+		print("Recorded " + state + " " + str(year))
+		time.sleep(1) # be polite to the atlas
+	warn_synthetic()
+		
+		
+# returns a county display name without its " County" or " City" suffix
+def base_name(name):
+	for suffix in [" County", " City"]:
+		if name.endswith(suffix):
+			return name[:-len(suffix)]
+	return name
+	
+# returns the rows of the table of one county on a datagraph page, with the percent and votes of each candidate
+def county_table(name, candidates, percents, votes):
+	html = ['<table class="data">']
+	for i in range(len(candidates)):
+		county = '<td rowspan="' + str(len(candidates)) + '" class="cnty"><b>' + name + '</b></td>' if i == 0 else ''
+		html.append('<tr>' + county + '<td class="cnd">' + candidates[i] + '</td><td class="per">' \
+		+ "%.2f" % percents[i] + '%</td><td class="dat">' + str(votes[i]) + '</td></tr>')
+	html.append('</table>')
+	return html
+	
+# returns a datagraph page for a state FIPS code and year, in the same format as the atlas, with every county of the
+# state in the county index and deterministic random results for the nominees of the year and a third candidate.
+# counties in atlas_names are written with the atlas spelling
+def synthetic_page(state_fips, year):
+	counties = pd.read_csv(es.county_index_file, encoding="utf-8")
+	counties = counties[counties["FIPS"] // 1000 == state_fips]
+	rng = random.Random(state_fips * 10000 + year)
+	candidates = list(es.nominees.get(year, ("Democrat", "Republican"))) + ["Other"]
+	
+	# the atlas lists a county and an independent city that share a name (such as Fairfax County and Fairfax City,
+	# Virginia) under that name alone, while names like Carson City keep their suffix
+	spellings = {key: name for (_, name, key, _) in atlas_names if not key is None}
+	bases = [base_name(name) for name in counties["County"]]
+	html = ['<html><head><meta charset="utf-8"><title>Data Graphs</title></head><body><div class="info">']
+	for (key, name, base) in zip(counties["FIPS"], counties["County"], bases):
+		if key in spellings:
+			name = spellings[key]
+		elif bases.count(base) > 1:
+			name = base
+		shares = [rng.random() for _ in candidates]
+		html += county_table(name, candidates, [100 * share / sum(shares) for share in shares], [rng.randint(100, 100000) for _ in candidates])
+	html.append('</div></body></html>')
+	return "\n".join(html).encode("utf-8")
+	
+# returns the recorded page for a state FIPS code and year if there is one, otherwise a synthetic page
+def page(state_fips, year):
+	path = fixture_path(state_fips, year)
+	if os.path.isfile(path):
+		with open(path, "rb") as f:
+			return f.read()
+	return synthetic_page(state_fips, year)
+	
+	
+# returns a datagraph page that is harder to parse than the synthetic pages: it is encoded as Windows-1252, has tables
+# outside the county div, uses character references, extra classes and whitespace, and has a candidate row whose name
+# cell has no cnd class
+def edge_page():
+	html = ['<html><head><meta http-equiv="Content-Type" content="text/html; charset=windows-1252"><title>Data Graphs</title></head><body>',
+	'<div class="header"><table><tr><td class="cnty"><b>Not a county</b></td><td class="per">1%</td></tr></table></div>',
+	'<div class="info wide">']
+	counties = [("Do\u00f1a Ana", ["Obama", "McCain", "Nader"]), ("Prince George&#39;s", ["Obama", "McCain"]), \
+	("St. Mary&#x27;s", ["Obama", "McCain", "Barr &amp; Root"]), ("Fairfax", ["Obama", "McCain"]), ("Fairfax", ["McCain", "Obama"])]
+	for (n, (name, candidates)) in enumerate(counties):
+		html.append('<table class="data">')
+		for i in range(len(candidates)):
+			county = '<td rowspan="' + str(len(candidates)) + '" class="cnty"><b>' + name + '</b></td>' if i == 0 else ''
+			cnd = '<td>' if n == 3 and i == 1 else '<td class="cnd  bold">'
+			html.append('<tr>' + county + cnd + candidates[i] + '</td>\n\t<td class="per right">' + "%.2f" % (60 - 20 * i + n) \
+			+ '%</td><td class="dat">' + str(1000 * (n + 1) + i) + '</td></tr>')
+		html.append('</table>')
+	html.append('</div><div class="info"><table><tr><td class="cnty"><b>After the counties</b></td><td class="per">1%</td></tr></table></div>')
+	html.append('</body></html>')
+	return "\n".join(html).encode("windows-1252")
+	
+faults = {} # maps (state FIPS, year) to the faults the stub server injects into the next requests for that page, in order
+served = {} # maps (state FIPS, year) to the number of requests the stub server has received for that page
+stub_lock = threading.Lock()
+slow_seconds = 2.0 # how long a "slow" fault waits before answering
+
+# returns a datagraph page for a state with the counties of atlas_names in that state, in order
+def atlas_names_page(state):
+	html = ['<html><head><meta charset="utf-8"><title>Data Graphs</title></head><body><div class="info">']
+	for (row, name) in enumerate([name for (other, name, _, _) in atlas_names if other == state]):
+		html += county_table(name, ["Obama", "McCain"], [60 - row, 40 + row], [1000 + row, 900 + row])
+	html.append('</div></body></html>')
+	return "\n".join(html).encode("utf-8")
+	
+# request handler of the stub server, which answers datagraph.php requests the way the atlas does. a request for a
+# page with faults left in faults is answered with the first of them instead: "503" or "500" (a server error), "429"
+# (too many requests, with a Retry-After of 0), "drop" (the connection is closed without an answer) or "slow" (the
+# answer is sent after slow_seconds)
+class StubHandler(BaseHTTPRequestHandler):
+	def do_GET(self):
+		query = parse_qs(urlparse(self.path).query)
+		key = (int(query["fips"][0]), int(query["year"][0]))
+		with stub_lock:
+			served[key] = served.get(key, 0) + 1
+			fault = faults[key].pop(0) if len(faults.get(key, [])) > 0 else None
+			
+		if fault == "drop":
+			self.close_connection = True
+			return
+		if fault in ["500", "503", "429"]:
+			self.send_response(int(fault))
+			if fault == "429":
+				self.send_header("Retry-After", "0")
+			self.send_header("Content-Length", "0")
+			self.end_headers()
+			return
+		if fault == "slow":
+			time.sleep(slow_seconds)
+			
+		body = page(key[0], key[1])
+		try:
+			self.send_response(200)
+			self.send_header("Content-Type", "text/html")
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+		except (BrokenPipeError, ConnectionResetError): # the client gave up waiting for a slow answer
+			self.close_connection = True
+		
+	def log_message(self, format, *args):
+		pass
+		
+# starts the stub server on a free local port and returns it along with the datagraph URL it serves
+def start_stub_server():
+	server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return (server, "http://127.0.0.1:" + str(server.server_address[1]) + "/RESULTS/datagraph.php")
+	
+	
+track_memory = False # set by --memory
+
+import_budget = 0.1 # seconds "import ElectionScraper" may take in a fresh interpreter
+heavy_modules = ["requests", "numpy", "pandas", "openpyxl", "colored", "bs4", "lxml", "pyarrow", "multiprocessing"]
+
+# paths checked by import_benchmarks: (name, code run after the import, heavy modules the path is expected to load).
+# the download path fills the cache that the later paths read from
+import_paths = [("import", "", []),
+("county lookup", "es.county_fips('Ohio', 'Franklin'); es.mapchart_id(39049)", []),
+("plan jobs", "es.plan_jobs([{'output': 'swing_mapchart', 'states': ['Ohio'], 'year1': 2008, 'year2': 2016}])", []),
+("download", "es.fetch_results([('Ohio', 2008), ('Ohio', 2016)])", ["requests", "numpy", "pandas"]),
+("MapChart from cached tables", "es.cache_only = True; es.create_swing_mapchart('Ohio', 2008, 2016, file_name=os.path.join(folder, 'swing.txt'))", \
+["numpy", "pandas", "colored"]),
+("Excel from cached tables", "es.cache_only = True; es.create_simple_excel('Ohio', 2008, file_name=os.path.join(folder, 'simple.xlsx'))", \
+["numpy", "pandas", "openpyxl", "colored"])]
+
+# runs func once and returns its time in seconds, and its peak memory in bytes if track_memory is set
+def measure(name, func):
+	if track_memory:
+		tracemalloc.start()
+	start = time.perf_counter()
+	func()
+	seconds = time.perf_counter() - start
+	peak = None
+	if track_memory:
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+	print(name + ": " + "%.3f" % seconds + "s", file=sys.stderr)
+	return {"benchmark": name, "seconds": seconds, "peak_bytes": peak}
+	
+	
+# times each stage of loading an election on its own for every fixture
+def stage_benchmarks():
+	results = []
+	pages = {}
+	tables = {}
+	loads = [(state, year) for (state, year) in fixtures]
+	
+	def fetch():
+		for (state, year) in loads:
+			pages[(state, year)] = private("__fetch_page")(state, year, fresh=True)
+	results.append(measure("stage: fetch", fetch))
+	
+	counties = {"fast": "__fast_counties", "lxml": "__lxml_counties", "bs4": "__bs4_counties"}
+	for backend in counties.keys():
+		if backend == "lxml" and importlib.util.find_spec("lxml") is None:
+			continue
+		results.append(measure("stage: parse (" + backend + ")", lambda: [private(counties[backend])(pages[load]) for load in loads]))
+		
+	# DataFrame construction is the full page parse minus the time spent in the parser
+	parse = measure("stage: parse and DataFrame", lambda: tables.update({load: private("__parse_page")(pages[load], load[0], es.parser_backend).frame() for load in loads}))
+	parser = [r for r in results if r["benchmark"] == "stage: parse (" + es.parser_backend + ")"][0]
+	results.append({"benchmark": "stage: DataFrame construction", "seconds": max(0.0, parse["seconds"] - parser["seconds"]), "peak_bytes": parse["peak_bytes"]})
+	
+	results.append(measure("stage: classification", lambda: [(private("__winners")(tables[load]), private("__margins")(tables[load])) for load in loads]))
+	return results
+	
+# times the MapChart and Excel output stages over every county in the country, with the elections already loaded
+def output_benchmarks(folder):
+	states = list(es.fips.keys())
+	loads = [(state, year) for state in states for year in [2008, 2016]]
+	
+	# keep every table in memory so the outputs are timed without loading anything
+	memory_size = es.memory_size
+	es.memory_size = len(loads)
+	es.fetch_results(loads)
+	try:
+		return [measure("output: create_simple_mapchart", lambda: es.create_simple_mapchart(states, 2008, file_name=os.path.join(folder, "simple.txt"))),
+		measure("output: create_margin_mapchart", lambda: es.create_margin_mapchart(states, 2008, file_name=os.path.join(folder, "margin.txt"))),
+		measure("output: create_swing_mapchart", lambda: es.create_swing_mapchart(states, 2008, 2016, file_name=os.path.join(folder, "swing.txt"))),
+		measure("output: create_simple_excel", lambda: es.create_simple_excel("Texas", 2008, file_name=os.path.join(folder, "simple.xlsx"))),
+		measure("output: create_swing_excel", lambda: es.create_swing_excel("Texas", 2008, 2016, file_name=os.path.join(folder, "swing.xlsx"))),
+		measure("output: create_results_workbook", lambda: es.create_results_workbook(states, [2008, 2016], file_name=os.path.join(folder, "results.xlsx")))]
+	finally:
+		es.memory_size = memory_size
+		private("__memory_tables").clear()
+		
+# measures the memory used by the county results of every state in 2008 and 2016, held as CountyResults and as the
+# DataFrames election_results returns. both count the data each one keeps: the arrays and the names a CountyResults
+# does not look up in the county index, and the index and every column of a DataFrame, including its county names
+def memory_benchmarks():
+	tables = private("__fetch_tables")([(state, year) for state in es.fips.keys() for year in [2008, 2016]])
+	compact = sum([table.memory_usage() for table in tables])
+	frames = sum([table.frame().memory_usage(deep=True).sum() for table in tables])
+	print("memory: float64 DataFrames: " + str(frames) + " bytes, CountyResults: " + str(compact) + " bytes", file=sys.stderr)
+	return [{"benchmark": "memory: float64 DataFrames", "seconds": None, "peak_bytes": None, "bytes": int(frames)},
+	{"benchmark": "memory: CountyResults", "seconds": None, "peak_bytes": None, "bytes": int(compact)}]
+	
+# times every public function end to end against the stub server, and the full Examples.py workload
+def end_to_end_benchmarks(folder):
+	states = ["Michigan", "Wisconsin", "Minnesota", "Ohio", "Indiana", "Illinois", "Iowa"]
+	results = [measure("election_results", lambda: es.election_results("Texas", 2016)),
+	measure("election_swings", lambda: es.election_swings("Virginia", 1984, 2008)),
+	measure("create_simple_excel", lambda: es.create_simple_excel("California", 2008, file_name=os.path.join(folder, "simple.xlsx"))),
+	measure("create_swing_excel", lambda: es.create_swing_excel("Michigan", 1984, 1996, file_name=os.path.join(folder, "swing.xlsx"))),
+	measure("create_simple_mapchart", lambda: es.create_simple_mapchart(states, 2008, file_name=os.path.join(folder, "simple.txt"))),
+	measure("create_swing_mapchart", lambda: es.create_swing_mapchart(states, 2008, 2016, file_name=os.path.join(folder, "swing.txt"))),
+	measure("create_margin_mapchart", lambda: es.create_margin_mapchart(states, 1964, file_name=os.path.join(folder, "margin.txt")))]
+	
+	cwd = os.getcwd()
+	os.chdir(folder)
+	try:
+		examples = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Examples.py")
+		results.append(measure("Examples.py", lambda: runpy.run_path(examples, run_name="__main__")))
+	finally:
+		os.chdir(cwd)
+	return results
+	
+
+# returns the heavy modules that importing modules loads in a fresh interpreter, such as pyarrow for pandas
+def loaded_by(modules):
+	script = "import sys\n" + "".join(["import " + module + "\n" for module in modules]) \
+	+ "print(','.join([m for m in " + repr(heavy_modules) + " if m in sys.modules]))"
+	return subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout.strip().split(",")
+	
+# runs each of import_paths in a fresh interpreter, with a cache of its own and downloads from the stub server at url.
+# returns the import time of each path along with the heavy modules it loaded, and warns about any path over
+# import_budget or loading modules that neither it nor the modules it needs import
+def import_benchmarks(folder, url):
+	repo = os.path.dirname(os.path.abspath(__file__))
+	cache = os.path.join(folder, "import cache")
+	results = []
+	for (name, code, expected) in import_paths:
+		script = "import os, sys, time, json\nsys.path.insert(0, " + repr(repo) + ")\nstart = time.perf_counter()\nimport ElectionScraper as es\n" \
+		+ "seconds = time.perf_counter() - start\nfolder = " + repr(folder) + "\nes.atlas_url, es.cache_dir, es.request_rate = " + repr(url) + ", " \
+		+ repr(cache) + ", None\n" + code + "\nprint(json.dumps({'seconds': seconds, 'modules': [m for m in " + repr(heavy_modules) \
+		+ " if m in sys.modules]}))\n"
+		run = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+		measured = json.loads(run.stdout.splitlines()[-1])
+		allowed = loaded_by(expected)
+		extra = [module for module in measured["modules"] if not module in allowed]
+		print("imports: " + name + ": " + "%.3f" % measured["seconds"] + "s, loaded " + (", ".join(measured["modules"]) or "no heavy modules"), file=sys.stderr)
+		if measured["seconds"] > import_budget:
+			print("Warning: importing took longer than the budget of " + str(import_budget) + "s", file=sys.stderr)
+		if len(extra) > 0:
+			print("Warning: " + name + " loaded " + ", ".join(extra) + " without needing them", file=sys.stderr)
+		results.append({"benchmark": "imports: " + name, "seconds": measured["seconds"], "peak_bytes": None, \
+		"modules": measured["modules"], "unexpected_modules": extra, "within_budget": measured["seconds"] <= import_budget})
+	return results
+	
+# checks import_benchmarks against the stub server: raises an AssertionError if importing ElectionScraper takes longer
+# than import_budget on any path, or if any path loads heavy modules it does not need. since the first import in a
+# while can be slowed down by the disk, paths over the budget are measured up to twice more and the fastest time is used
+def check_imports():
+	server, url = start_stub_server()
+	try:
+		with tempfile.TemporaryDirectory() as folder:
+			results = import_benchmarks(folder, url)
+			for _ in range(2):
+				if all([result["within_budget"] for result in results]):
+					break
+				for (result, again) in zip(results, import_benchmarks(folder, url)):
+					result["seconds"] = min(result["seconds"], again["seconds"])
+					result["within_budget"] = result["seconds"] <= import_budget
+	finally:
+		server.shutdown()
+	failures = [result["benchmark"] + " took " + "%.3f" % result["seconds"] + "s" for result in results if not result["within_budget"]] \
+	+ [result["benchmark"] + " loaded " + ", ".join(result["unexpected_modules"]) for result in results if len(result["unexpected_modules"]) > 0]
+	if len(failures) > 0:
+		raise AssertionError("imports over the budget of " + str(import_budget) + "s or loading modules they do not need: " + "; ".join(failures))
+	print("imports: every path is within the budget and only loads the modules it needs", file=sys.stderr)
+	
+
+# checks that every parser backend returns the same counties as the BeautifulSoup reference for the page of every
+# fixture (recorded or synthetic), for edge_page and for the atlas_names pages, and that with every backend each county
+# of atlas_names is given its expected FIPS code and MapChart path ID. raises an AssertionError for the first page that
+# fails
+def check_parsers():
+	backends = {"fast": "__fast_counties", "lxml": "__lxml_counties", "bs4": "__bs4_counties"}
+	if importlib.util.find_spec("lxml") is None:
+		del backends["lxml"]
+	states = list(dict.fromkeys([state for (state, _, _, _) in atlas_names]))
+	pages = [(state + " " + str(year), state, page(es.fips[state], year)) for (state, year) in fixtures] + [("edge page", "Virginia", edge_page())] \
+	+ [("atlas names of " + state, state, atlas_names_page(state)) for state in states]
+	for (name, state, content) in pages:
+		reference = private("__bs4_counties")(content)
+		for (backend, counties) in backends.items():
+			if private(counties)(content) != reference:
+				raise AssertionError("the " + backend + " parser does not match the bs4 parser on " + name)
+				
+	for state in states:
+		expected = [(key, path) for (other, _, key, path) in atlas_names if other == state]
+		for backend in backends.keys():
+			results = private("__parse_page")(atlas_names_page(state), state, backend)
+			counties = results.counties
+			found = [(None if key < 0 else key, es.mapchart_id(key, counties[i], state)) for (i, key) in enumerate(results.fips.tolist())]
+			if found != expected:
+				raise AssertionError("the " + backend + " parser gave the counties of " + state + " the codes " + str(found) \
+				+ " instead of " + str(expected))
+	print("parsers: " + ", ".join(backends.keys()) + " match on " + str(len(pages)) + " pages and give " + str(len(atlas_names)) \
+	+ " atlas names their expected codes", file=sys.stderr)
+	
+
+# checks the retries of downloads and the checkpoints of crawl against the stub server: a page that fails with a 503,
+# a 429, a dropped connection and a slow answer is loaded after retrying each of them, a page that keeps failing is
+# given up on after es.retries retries, and a crawl run again with the same checkpoint only loads the page that failed.
+# raises an AssertionError if any of them does not behave as expected
+def check_retries():
+	server, url = start_stub_server()
+	settings = (es.atlas_url, es.cache_enabled, es.cache_dir, es.request_rate, es.request_timeout, es.retries, es.retry_backoff)
+	es.atlas_url, es.request_rate, es.request_timeout, es.retries, es.retry_backoff = (url, None, slow_seconds / 4, 4, 0.01)
+	flaky, failing, good = [("Ohio", 2008), ("Iowa", 2008), ("Utah", 2008)]
+	key = lambda load: (es.fips[load[0]], load[1])
+	
+	def expect(condition, message):
+		if not condition:
+			raise AssertionError(message)
+			
+	try:
+		with tempfile.TemporaryDirectory() as folder, contextlib.redirect_stdout(sys.stderr):
+			es.cache_enabled, es.cache_dir = (True, os.path.join(folder, "cache"))
+			checkpoint = os.path.join(folder, "checkpoint.json")
+			with stub_lock:
+				served.clear()
+				faults.clear()
+				faults[key(flaky)] = ["503", "429", "drop", "slow"]
+				faults[key(failing)] = ["500"] * (es.retries + 1)
+				
+			stats = es.enable_stats()
+			try:
+				failed = es.crawl([flaky, failing, good], checkpoint_file=checkpoint)
+			finally:
+				es.disable_stats()
+			retried = [event for event in stats.events if event["stage"] == "retry"]
+			expect(failed == [failing], "the first crawl failed " + str(failed) + " instead of " + str([failing]))
+			expect(served.get(key(flaky)) == 5, "the flaky page was requested " + str(served.get(key(flaky))) + " times instead of 5")
+			expect(served.get(key(failing)) == es.retries + 1, "the failing page was requested " + str(served.get(key(failing))) \
+			+ " times instead of " + str(es.retries + 1))
+			expect(served.get(key(good)) == 1, "the good page was requested " + str(served.get(key(good))) + " times instead of 1")
+			expect(len(retried) == 4 + es.retries, str(len(retried)) + " retries were recorded instead of " + str(4 + es.retries))
+			
+			with open(checkpoint) as f:
+				saved = json.load(f)
+			expect(sorted([tuple(load) for load in saved["done"]]) == sorted([flaky, good]), "the checkpoint has " + str(saved["done"]) + " as done")
+			expect([tuple(load[:2]) for load in saved["failed"]] == [failing], "the checkpoint has " + str(saved["failed"]) + " as failed")
+			
+			# the crawl resumes from the checkpoint, and the failing page now loads
+			failed = es.crawl([flaky, failing, good], checkpoint_file=checkpoint)
+			expect(failed == [], "the resumed crawl failed " + str(failed))
+			expect([served.get(key(load)) for load in [flaky, failing, good]] == [5, es.retries + 2, 1], \
+			"the resumed crawl requested " + str(served) + " instead of only the page that failed")
+			with open(checkpoint) as f:
+				saved = json.load(f)
+			expect(len(saved["done"]) == 3 and saved["failed"] == [], "the resumed checkpoint is " + str(saved))
+	finally:
+		es.atlas_url, es.cache_enabled, es.cache_dir, es.request_rate, es.request_timeout, es.retries, es.retry_backoff = settings
+		server.shutdown()
+	print("retries: " + str(len(retried)) + " retries and a resumed crawl behaved as expected", file=sys.stderr)
+	
+
+# checks that the DataFrames returned by election_results, fetch_results, iter_results and election_swings can be
+# changed in place with iloc and loc, whether the tables are kept in memory, loaded from the disk cache or just parsed,
+# and that changing them does not change the tables later calls and every other caller share. raises an AssertionError
+# if they cannot be changed or the shared tables change
+def check_shared_tables():
+	server, url = start_stub_server()
+	settings = (es.atlas_url, es.cache_enabled, es.cache_dir, es.request_rate, es.memory_size)
+	es.atlas_url, es.request_rate = (url, None)
+	try:
+		with tempfile.TemporaryDirectory() as folder:
+			for (memory_size, cache_enabled) in [(0, False), (0, True), (10, False), (10, True)]:
+				es.memory_size, es.cache_enabled, es.cache_dir = (memory_size, cache_enabled, os.path.join(folder, str(memory_size)))
+				setting = "memory_size = " + str(memory_size) + (" with" if cache_enabled else " without") + " the disk cache"
+				expected = es.election_results("Ohio", 2008).copy()
+				frames = [es.election_results("Ohio", 2008), es.fetch_results([("Ohio", 2008)])[0], next(es.iter_results([("Ohio", 2008)]))[2], \
+				es.election_swings("Ohio", 2008, 2016)]
+				for results in frames:
+					column = results.columns[1]
+					results.iloc[0, 1] = 99.0
+					results.loc[results.index[1], column] = 98.0
+					results[results.columns[2]] *= 2
+					results["County"] = "Changed"
+					if results.iloc[0, 1] != 99.0 or results.loc[results.index[1], column] != 98.0:
+						raise AssertionError("a DataFrame could not be changed in place with " + setting)
+				for (name, results) in [("election_results", es.election_results("Ohio", 2008)), ("fetch_results", es.fetch_results([("Ohio", 2008)])[0])]:
+					if not results.equals(expected):
+						raise AssertionError(name + " returned a table changed by an earlier caller with " + setting)
+				if not (expected.iloc[:, 1:].round(2) == expected.iloc[:, 1:]).all().all():
+					raise AssertionError("election_results returned percents that are not rounded to two decimals with " + setting)
+				private("__memory_tables").clear()
+	finally:
+		es.atlas_url, es.cache_enabled, es.cache_dir, es.request_rate, es.memory_size = settings
+		private("__memory_tables").clear()
+		server.shutdown()
+	print("shared tables: returned DataFrames can be changed without changing the tables other callers share", file=sys.stderr)
+	
+
+# runs every benchmark against the stub server with the cache disabled and returns the results
+def run():
+	server, url = start_stub_server()
+	settings = (es.atlas_url, es.cache_enabled, es.request_rate, es.store_dir)
+	es.atlas_url, es.cache_enabled, es.request_rate, es.store_dir = (url, False, None, None)
+	es.county_display(0) # load the county index before timing
+	warn_synthetic()
+	try:
+		check_parsers()
+		with tempfile.TemporaryDirectory() as folder, contextlib.redirect_stdout(sys.stderr):
+			results = import_benchmarks(folder, url) + stage_benchmarks() + output_benchmarks(folder) + memory_benchmarks() \
+			+ end_to_end_benchmarks(folder)
+	finally:
+		es.atlas_url, es.cache_enabled, es.request_rate, es.store_dir = settings
+		server.shutdown()
+		
+	synthetic = synthetic_fixtures()
+	return {"python": platform.python_version(), "pandas": pd.__version__, "parser_backend": es.parser_backend, \
+	"max_workers": es.max_workers, "recorded_fixtures": len(fixtures) - len(synthetic), \
+	"synthetic_fixtures": [state + " " + str(year) for (state, year) in synthetic], "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}
+	
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Offline benchmarks for the election scraper")
+	parser.add_argument("command", nargs="?", default="run", choices=["run", "record", "check"])
+	parser.add_argument("--output", help="file to write the JSON results to")
+	parser.add_argument("--memory", action="store_true", help="record the peak memory of each benchmark")
+	args = parser.parse_args()
+	track_memory = args.memory
+	
+	if args.command == "record":
+		record()
+	elif args.command == "check":
+		warn_synthetic()
+		check_parsers()
+		check_retries()
+		check_shared_tables()
+		check_imports()
+	else:
+		results = run()
+		if args.output is None:
+			print(json.dumps(results, indent=1))
+		else:
+			with open(args.output, "w") as f:
+				json.dump(results, f, indent=1)
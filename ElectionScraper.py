@@ -11,16 +11,28 @@ Dave Leip's Atlas of U.S. Presidential Elections. http://uselectionatlas.org (17
 
 
 required modules: requests, numpy, pandas, openpyxl, colored, BeautifulSoup
+optional modules: pyarrow (build_store and read_store), lxml (parser_backend = "lxml")
 If the program does not compile, try "pip install" on these modules
+
+Only the standard library is imported with the module. Each of the modules above is imported the first time it is
+needed: requests for downloading, numpy and pandas for tables, openpyxl for Excel files, colored for messages and
+BeautifulSoup for parser_backend = "bs4". A program that only looks up counties or plans jobs never imports them,
+and one that makes MapChart files from cached tables never imports requests or openpyxl
 '''
 
-import requests
-import numpy as np
-import pandas as pd
-import openpyxl
-import colored
-from bs4 import BeautifulSoup
-from collections import defaultdict
+import os
+import re
+import json
+import pickle
+import zlib
+import csv
+import time
+import random
+import threading
+from collections import defaultdict, OrderedDict
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
 
 # maps states to their corresponding FIPS value for the atlas. Alaska and Louisiana data are not avaiable.
 fips = {"Alabama": 1, "Arizona": 4, "Arkansas": 5, "California": 6, "Colorado": 8, "Connecticut" : 9, "Delaware": 10, "DC": 11, "Florida": 12, "Georgia": 13, \
@@ -37,180 +49,1462 @@ abbs = {"Alabama": "AL", "Arizona": "AZ", "Arkansas": "AR", "California": "CA",
 "Oregon": "OR", "Pennsylvania": "PA", "Rhode Island": "RI", "South Carolina": "SC", "South Dakota": "SD", "Tennessee": "TN", "Texas": "TX", "Utah": "UT", "Vermont": "VT", \
 "Virginia": "VA", "Washington": "WA", "West Virginia": "WV", "Wisconsin": "WI", "Wyoming": "WY"}
 
-blue = colored.fg("#5678ff")
-orange = colored.fg("#ff9072")
-res = colored.attr("reset")
+# settings for the on-disk cache of atlas pages and parsed county tables. pages are stored in <cache_dir>/html and
+# parsed tables in <cache_dir>/tables. the least recently used files are removed once the cache grows past cache_size bytes
+cache_dir = os.path.join(os.path.expanduser("~"), ".election_cache")
+cache_size = 512 * 1024 * 1024
+cache_enabled = True
+cache_only = False # if True, never go to the atlas and raise an error for anything that is not already cached
+__cache_usage = {} # maps each cache_dir to the bytes its files use, listed once and then kept up to date by each write
+__cache_lock = threading.Lock()
+
+# number of parsed tables kept in memory and shared by every thread, dropping the least recently used. 0 keeps none
+memory_size = 0
+
+__memory_tables = OrderedDict() # (state, year) -> DataFrame, least recently used first
+__memory_lock = threading.Lock()
+
+# folder of the columnar dataset written by build_store, partitioned as <store_dir>/year=<year>/fips=<fips>/part.parquet.
+# when set, election_results reads any election in the store from there before trying the cache or the atlas
+store_dir = None
+
+__batch_tables = None # tables shared by every output of run_jobs, keyed by (state, year)
+
+# settings for downloading from the atlas. pages for several states or years are fetched in parallel by up to max_workers
+# threads sharing one pooled session, and no more than request_rate requests per second are sent to a single host
+atlas_url = "https://uselectionatlas.org/RESULTS/datagraph.php"
+max_workers = 8
+request_rate = 5.0 # set to None to disable rate limiting
+parser_backend = "fast" # how datagraph pages are parsed: "fast" (streaming tokenizer), "lxml", or "bs4" (BeautifulSoup reference)
+parse_processes = None # number of processes that parse pages in fetch_results while downloads continue. None parses in the download threads
+
+# requests that time out, lose their connection or get a 5xx or 429 response are sent again up to retries times, after
+# a random delay of up to retry_backoff seconds that doubles with every attempt (or the server's Retry-After, if longer)
+request_timeout = 30 # seconds to wait for the atlas to connect or send data
+retries = 4
+retry_backoff = 0.5
+
+__session = None
+__session_lock = threading.Lock()
+__host_slots = {} # maps each host to the earliest time the next request may be sent
+__host_lock = threading.Lock()
+
+# (Democratic, Republican) nominees for each election, used to line up the major party columns between elections
+nominees = {1892: ("Cleveland", "Harrison"), 1896: ("Bryan", "McKinley"), 1900: ("Bryan", "McKinley"), 1904: ("Parker", "Roosevelt"), \
+1908: ("Bryan", "Taft"), 1912: ("Wilson", "Taft"), 1916: ("Wilson", "Hughes"), 1920: ("Cox", "Harding"), 1924: ("Davis", "Coolidge"), \
+1928: ("Smith", "Hoover"), 1932: ("Roosevelt", "Hoover"), 1936: ("Roosevelt", "Landon"), 1940: ("Roosevelt", "Willkie"), 1944: ("Roosevelt", "Dewey"), \
+1948: ("Truman", "Dewey"), 1952: ("Stevenson", "Eisenhower"), 1956: ("Stevenson", "Eisenhower"), 1960: ("Kennedy", "Nixon"), 1964: ("Johnson", "Goldwater"), \
+1968: ("Humphrey", "Nixon"), 1972: ("McGovern", "Nixon"), 1976: ("Carter", "Ford"), 1980: ("Carter", "Reagan"), 1984: ("Mondale", "Reagan"), \
+1988: ("Dukakis", "Bush"), 1992: ("Clinton", "Bush"), 1996: ("Clinton", "Dole"), 2000: ("Gore", "Bush"), 2004: ("Kerry", "Bush"), 2008: ("Obama", "McCain"), \
+2012: ("Obama", "Romney"), 2016: ("Clinton", "Trump"), 2020: ("Biden", "Trump"), 2024: ("Harris", "Trump")}
+
+# party of the national winner of each election, 0 for Democrats and 1 for Republicans, used by index_bellwethers
+national_winners = {1892: 0, 1896: 1, 1900: 1, 1904: 1, 1908: 1, 1912: 0, 1916: 0, 1920: 1, 1924: 1, 1928: 1, 1932: 0, 1936: 0, \
+1940: 0, 1944: 0, 1948: 0, 1952: 1, 1956: 1, 1960: 0, 1964: 0, 1968: 1, 1972: 1, 1976: 0, 1980: 1, 1984: 1, 1988: 1, 1992: 0, \
+1996: 0, 2000: 1, 2004: 1, 2008: 0, 2012: 0, 2016: 1, 2020: 0, 2024: 1}
+
+# table of every county with its FIPS code, display name, MapChart path ID and the names it has appeared under,
+# built from the US Census Bureau county lists. it is loaded on first use
+county_index_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "county_index.csv")
+__county_lookup = None # maps (state FIPS, normalized name) to the county FIPS codes with that name
+__county_info = None # maps county FIPS codes to (display name, MapChart path ID)
+__county_lock = threading.Lock()
+
+__stats = None # the ScraperStats receiving measurements while instrumentation is enabled
+
+__terminal_colors = None # blue, orange and res, made by colored the first time a message is printed
+
+# private method that returns the terminal colors, importing colored on first use
+def __colors():
+	global __terminal_colors
+	if __terminal_colors is None:
+		import colored
+		__terminal_colors = {"blue": colored.fg("#5678ff"), "orange": colored.fg("#ff9072"), "res": colored.attr("reset")}
+	return __terminal_colors
+	
+# private method that prints a message in a terminal color, blue for success and orange for warnings
+def __print(color, message, end="\n"):
+	colors = __colors()
+	print(colors[color] + message + colors["res"], end=end)
+	
+# blue, orange and res can still be read from the module as the terminal color codes
+def __getattr__(name):
+	if name in ["blue", "orange", "res"]:
+		return __colors()[name]
+	raise AttributeError("module " + __name__ + " has no attribute " + name)
+
+# collects the measurements made while instrumentation is enabled with enable_stats: the time of every stage for each
+# state and year, HTTP requests with their bytes and latency, cache hits and misses, retries and rows processed.
+# every measurement is also passed to the callback, if one is given, as a dictionary
+class ScraperStats:
+	def __init__(self, callback=None, trace_file=None):
+		self.callback = callback
+		self.trace_file = trace_file
+		self.events = [] # every measurement, in the order they were made
+		self.lock = threading.Lock()
+		self.origin = time.perf_counter()
+		
+	# records one measurement. start is the time.perf_counter() value when the stage started
+	def record(self, stage, state, year, start, seconds, values):
+		event = {"stage": stage, "state": state, "year": year, "start": start - self.origin, "seconds": seconds, \
+		"thread": threading.get_ident()}
+		event.update(values)
+		with self.lock:
+			self.events.append(event)
+		if not self.callback is None:
+			self.callback(event)
+			
+	# returns the totals of every stage, of every stage for each state and year, of HTTP requests, of the cache, of
+	# retries and of rows processed, as a dictionary
+	def summary(self):
+		with self.lock:
+			events = list(self.events)
+		stages = {}
+		states = {}
+		http = {"requests": 0, "bytes": 0, "seconds": 0.0, "max_seconds": 0.0}
+		cache = {"hits": 0, "misses": 0}
+		retries = 0
+		rows = 0
+		for event in events:
+			stage = stages.setdefault(event["stage"], {"calls": 0, "seconds": 0.0})
+			stage["calls"] += 1
+			stage["seconds"] += event["seconds"]
+			if not event["state"] is None:
+				name = event["state"] + ("" if event["year"] is None else " " + str(event["year"]))
+				totals = states.setdefault(name, {})
+				totals[event["stage"]] = totals.get(event["stage"], 0.0) + event["seconds"]
+			if event["stage"] == "fetch":
+				http["requests"] += 1
+				http["bytes"] += event.get("bytes", 0)
+				http["seconds"] += event["seconds"]
+				http["max_seconds"] = max(http["max_seconds"], event["seconds"])
+			elif event["stage"] == "cache":
+				cache["hits" if event["hit"] else "misses"] += 1
+			elif event["stage"] == "retry":
+				retries += 1
+			rows += event.get("rows", 0)
+		return {"stages": stages, "states": states, "http": http, "cache": cache, "retries": retries, "rows": rows}
+		
+	# writes every measurement to path as a trace that can be opened in chrome://tracing or Perfetto
+	def write_trace(self, path):
+		with self.lock:
+			events = list(self.events)
+		trace = []
+		for event in events:
+			args = {k: v for (k, v) in event.items() if not k in ["stage", "start", "seconds", "thread"]}
+			trace.append({"name": event["stage"], "cat": "ElectionScraper", "ph": "X", "ts": event["start"] * 1e6, \
+			"dur": event["seconds"] * 1e6, "pid": os.getpid(), "tid": event["thread"], "args": args})
+		with open(path, "w") as f:
+			json.dump({"traceEvents": trace}, f)
+			
+			
+# turns on instrumentation and returns the ScraperStats that collects the measurements. callback is called with
+# every measurement as it is made, and if trace_file is given a profiling trace is written there by disable_stats.
+# while instrumentation is disabled, which is the default, no measurements are kept
+def enable_stats(callback=None, trace_file=None):
+	global __stats
+	__stats = ScraperStats(callback, trace_file)
+	return __stats
+	
+# turns off instrumentation, writes the trace file if one was requested, and returns the ScraperStats
+def disable_stats():
+	global __stats
+	stats = __stats
+	__stats = None
+	if not stats is None and not stats.trace_file is None:
+		stats.write_trace(stats.trace_file)
+	return stats
+	
+	
+# private method that reduces a county name to lowercase letters and digits so that atlas and census spellings match
+def __normalize(name):
+	return "".join([c for c in name.casefold().replace("&", "and") if c.isalnum()])
+	
+# private method that loads county_index.csv into the lookup tables, once
+def __load_county_index():
+	global __county_lookup, __county_info
+	with __county_lock:
+		if not __county_lookup is None:
+			return
+		lookup = defaultdict(lambda: [])
+		info = {}
+		with open(county_index_file, encoding="utf-8", newline="") as f:
+			for row in csv.DictReader(f):
+				key = int(row["FIPS"])
+				info[key] = (row["County"], row["MapChart"])
+				for name in row["Names"].split("|"):
+					if not key in lookup[(key // 1000, __normalize(name))]:
+						lookup[(key // 1000, __normalize(name))].append(key)
+		__county_info = info
+		__county_lookup = dict(lookup)
+		
+# returns the county FIPS code for a county name as it appears in the atlas. when a name belongs to both a county and an
+# independent city (such as Fairfax, Virginia), the county is returned first and the city once the county code is in used
+# counties that are not in the index get a stable negative code made from their name
+def county_fips(state, name, used=()):
+	if __county_lookup is None:
+		__load_county_index()
+	for key in __county_lookup.get((fips[state], __normalize(name)), []):
+		if not key in used:
+			return key
+			
+	key = -(zlib.crc32((state + "|" + __normalize(name)).encode("utf-8")) % 1000000000)
+	while key in used:
+		key -= 1
+	return key
+	
+# returns the display name of a county FIPS code, or default if the code is not in the index
+def county_display(key, default=None):
+	if __county_info is None:
+		__load_county_index()
+	info = __county_info.get(key)
+	return default if info is None else info[0]
+	
+# returns the MapChart path ID of a county FIPS code. counties that are not in the index are given an ID built from
+# their name, in the same way MapChart builds its IDs
+def mapchart_id(key, name=None, state=None):
+	if __county_info is None:
+		__load_county_index()
+	info = __county_info.get(key)
+	if not info is None:
+		return info[1]
+	return name.replace(" ", "_").replace("'","_").replace(".","_").replace("-","_") + "__" + abbs[state]
+	
 
 # private method that converts a percentage string (ending with '%') into a float value
 def __percent(s):
 	return float(s[:-1])
 	
-# private method that returns whether a key exists in a dictionary
-def __contains_key(dict, key):
-	try:
-		dict[key]
-		return True
-	except:
-		return False
-		
-# private method that takes in a DataFrame row and returns the winner and the margin, in tuple form
-def __winner(row):
-	order = defaultdict(lambda: []) # maps the % of each candidate with the indexes associated with that %
-	for v in range(1, len(row)):
-		order[row[v]].append(v)
-	
-	keys = list(order.keys()) # list of % received by each candidate
-	keys.sort(reverse=True)
-	if len(order[keys[0]]) > 1: # in case of a first place tie
-		return (None,0)
-		
-	results = [order[k][0] for k in keys] # list of column indexes for each candidate in order of vote %
-	return (row.axes[0][results[0]][:-2], keys[0] - keys[1])
-
-# private method that takes in a DataFrame row and returns the winner and the margin level, in tuple form	
-def __margin(row):
-	w,m = __winner(row)
-	
-	if m < 10:
-		return (w,0)
-	elif m < 20:
-		return (w,1)
-	elif m < 30:
-		return (w,2)
-	else:
-		return (w,3)
-	
-# private method that takes in corresponding rows from each election year and computes the margin swing between elections
-def __swing(row):
-	swing = row["Swing"]
-	if np.isnan(swing):
-		return (None,None)
-	
-	# indexes used for the color scheme
-	aswing = abs(swing)
-	m = 0
-	if swing == 0:
-		return (2,m)
-	
-	if 0 < aswing < 5:
-		m = 0
-	elif 5 <= aswing < 10:
-		m = 1
-	elif 10 <= aswing < 20:
-		m = 2
-	elif 15 <= aswing < 30:
-		m = 3
-	elif 20 <= aswing < 40:
-		m = 4
-	elif 30 <= aswing < 50:
-		m = 5
+# private method that takes in a DataFrame of election results and returns, as arrays with one entry per county, the index
+# of the winning candidate column (not counting the County column, -1 in case of a tie), the margin, and a mask of tied counties
+def __winners(results):
+	import numpy as np
+	values = __percent_values(results)
+	if values.shape[1] == 0:
+		return (np.full(len(values), -1), np.zeros(len(values)), np.ones(len(values), dtype=bool))
+		
+	top = values.max(axis=1)
+	if values.shape[1] > 1:
+		second = np.partition(values, -2, axis=1)[:, -2] # second highest % in each county
 	else:
-		m = 6
+		second = np.zeros(len(values))
+	ties = (values == top[:, None]).sum(axis=1) > 1 # first place ties
 	
-	if swing > 0: # shift towards Democrats
-		return (0,m)
-	else:
-		return (1,m) # shift towards Republicans
+	winners = np.where(ties, -1, values.argmax(axis=1))
+	margins = np.where(ties, 0.0, top - second)
+	return (winners, margins, ties)
+	
+# private method that takes in a DataFrame of election results and returns the winner indexes, margins, margin levels
+# and tie mask as arrays. the levels are 0 for a margin under 10%, 1 under 20%, 2 under 30% and 3 otherwise
+def __margins(results):
+	import numpy as np
+	winners, margins, ties = __winners(results)
+	return (winners, margins, np.digitize(margins, [10, 20, 30]), ties)
+	
+# private method that takes in a DataFrame of election swings and returns the swing direction (0 towards Democrats,
+# 1 towards Republicans, 2 for no shift), the swing level used for the color scheme and a mask of counties with missing
+# data, as arrays. the levels are 0 for a swing under 5%, then under 10, 20, 30, 40 and 50%, and 6 for 50% or more
+def __swing_levels(results):
+	import numpy as np
+	swing = results["Swing"].to_numpy(dtype=float)
+	missing = np.isnan(swing)
+	
+	directions = np.where(swing > 0, 0, np.where(swing < 0, 1, 2))
+	levels = np.digitize(np.abs(np.where(missing, 0.0, swing)), [5, 10, 20, 30, 40, 50])
+	return (directions, levels, missing)
 	
 
-# returns a pandas DataFrame with county level data for the election
-def election_results(state, year):
-	request = requests.get("https://uselectionatlas.org/RESULTS/datagraph.php?year=" + str(year) + "&fips=" + str(fips[state]))
-	soup = BeautifulSoup(request.content, "html.parser")
-	tables = soup.body.find("div", {"class": "info"}).find_all("table") # list of tables, each table corresponding to a county
-	results = {} # will contain integer results for each county
-	all_candidates = {} # running list of all candidates on the ballot in this state
+# private method that returns the cache file path for a state and year in the given tier ("html" or "tables")
+def __cache_path(tier, state, year):
+	ext = ".html" if tier == "html" else ".pkl"
+	return os.path.join(cache_dir, tier, str(fips[state]) + "_" + str(year) + ext)
 	
-	# add the value for every county individually
-	for county in tables:
-		values = county.find_all("tr") # list of candidate rows for the county		
-		county_name = values[0].find("td").b.string
-		
-		# deal with exceptions with independent cities and counties of the same name
-		for (exception,exception_state) in [("Baltimore","Maryland"), ("Fairfax","Virginia"), ("Richmond", "Virginia"), \
-		("Bedford", "Virginia"), ("Franklin", "Virginia"), ("Roanoke","Virginia"), ("St. Louis", "Missouri")]:
-			if county_name == exception and state == exception_state:
-				if not __contains_key(results, exception + " County"):
-					county_name = exception + " County"
-				else:
-					county_name = exception + " City"
+# private method that marks a cache file as recently used
+def __cache_touch(path):
+	try:
+		os.utime(path, None)
+	except OSError:
+		pass
+		
+# private method that lists the cache and removes the least recently used files until it uses at most 90% of cache_size,
+# so that the next writes do not have to list it again. must be called with __cache_lock held
+def __cache_evict():
+	files = [] # (last use, size, path) for every file in the cache
+	for tier in ["html", "tables"]:
+		folder = os.path.join(cache_dir, tier)
+		if not os.path.isdir(folder):
+			continue
+		for name in os.listdir(folder):
+			path = os.path.join(folder, name)
+			try:
+				stat = os.stat(path)
+			except OSError:
+				continue
+			files.append((stat.st_mtime, stat.st_size, path))
+			
+	total = sum([f[1] for f in files])
+	if total > cache_size:
+		files.sort()
+		for (_, size, path) in files:
+			if total <= cache_size * 0.9:
+				break
+			try:
+				os.remove(path)
+				total -= size
+			except OSError:
+				pass
+	__cache_usage[cache_dir] = total
+			
+# private method that writes data to a cache file, replacing it atomically so an interrupted write never leaves a partial file.
+# the cache is only listed on the first write and when the running total of its size goes over cache_size
+def __cache_write(path, write):
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	temp = path + "." + str(threading.get_ident()) + ".tmp"
+	write(temp)
+	size = os.path.getsize(temp)
+	try:
+		size -= os.path.getsize(path) # the file being replaced
+	except OSError:
+		pass
+	os.replace(temp, path)
+	with __cache_lock:
+		if not cache_dir in __cache_usage or __cache_usage[cache_dir] + size > cache_size:
+			__cache_evict()
+		else:
+			__cache_usage[cache_dir] += size
+	
+# removes cached pages and tables, on disk and in memory. with no arguments the whole cache is cleared, otherwise only
+# the entries matching the given state and/or year are removed
+def invalidate_cache(state=None, year=None):
+	with __memory_lock:
+		for key in list(__memory_tables.keys()):
+			if (state is None or key[0] == state) and (year is None or key[1] == year):
+				del __memory_tables[key]
+	with __cache_lock:
+		__cache_usage.pop(cache_dir, None) # listed again on the next write
+				
+	for tier in ["html", "tables"]:
+		folder = os.path.join(cache_dir, tier)
+		if not os.path.isdir(folder):
+			continue
+		for name in os.listdir(folder):
+			key = os.path.splitext(name)[0].split("_")
+			if not state is None and key[0] != str(fips[state]):
+				continue
+			if not year is None and key[-1] != str(year):
+				continue
+			os.remove(os.path.join(folder, name))
+			
+
+# private method that returns the shared HTTP session, creating it with a connection pool sized for max_workers on first use
+def __get_session():
+	global __session
+	import requests
+	from requests.adapters import HTTPAdapter
+	with __session_lock:
+		if __session is None:
+			session = requests.Session()
+			adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(max_workers, 1))
+			session.mount("http://", adapter)
+			session.mount("https://", adapter)
+			__session = session
+	return __session
+	
+# private method that blocks until another request may be sent to the host of the url without exceeding request_rate
+def __wait_for_host(url):
+	if not request_rate:
+		return
+	host = urlparse(url).netloc
+	with __host_lock:
+		now = time.monotonic()
+		slot = max(now, __host_slots.get(host, now))
+		__host_slots[host] = slot + 1.0 / request_rate
+	if slot > now:
+		time.sleep(slot - now)
+		
+
+# private method that returns the raw datagraph page for a state and year, from the cache if possible. if fresh is True
+# the page is always downloaded again
+def __fetch_page(state, year, fresh=False):
+	start = time.perf_counter()
+	path = __cache_path("html", state, year)
+	content = None
+	if cache_enabled and not fresh:
+		try:
+			with open(path, "rb") as f:
+				content = f.read()
+		except FileNotFoundError: # not cached, or just evicted by another thread
+			pass
+	if not content is None:
+		__cache_touch(path)
+		if not __stats is None:
+			__stats.record("cache", state, year, start, time.perf_counter() - start, {"tier": "html", "hit": True})
+		return content
+		
+	if cache_only:
+		raise LookupError(state + " " + str(year) + " is not cached and cache_only is enabled")
+	if not __stats is None and cache_enabled:
+		__stats.record("cache", state, year, start, time.perf_counter() - start, {"tier": "html", "hit": False})
+		
+	import requests
+	url = atlas_url + "?year=" + str(year) + "&fips=" + str(fips[state])
+	for attempt in range(retries + 1):
+		__wait_for_host(url)
+		start = time.perf_counter()
+		wait = 0.0 # seconds the server asked us to wait
+		try:
+			request = __get_session().get(url, timeout=request_timeout)
+			if request.status_code < 500 and request.status_code != 429:
+				request.raise_for_status()
+				content = request.content
 				break
-					
-		if county_name == "District of Columbia": # Washington DC edge case
-			county_name = "Washington"
-		# small changes in county names
-		elif county_name == "Dewitt" and state == "Texas":
-			county_name = "DeWitt"
-		elif county_name == "Desoto" and state == "Florida":
-			county_name = "DeSoto"
-		elif county_name == "Dade" and state == "Florida":
-			county_name = "Miami-Dade"
-		elif county_name == "Ormsby" and state == "Nevada":
-			county_name = "Carson City"
-		elif county_name == "Shannon" and state == "South Dakota":
-			county_name = "Oglala Lakota"
-		
-		candidate_results = defaultdict(lambda: 0.0) # results for each candidate in the county
+			if request.headers.get("Retry-After", "").isdigit():
+				wait = float(request.headers["Retry-After"])
+			error = requests.HTTPError(str(request.status_code) + " error for url: " + url, response=request)
+		except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+			error = e
+		if attempt == retries:
+			raise error
+			
+		delay = max(wait, random.uniform(0, retry_backoff * 2 ** attempt))
+		if not __stats is None:
+			__stats.record("retry", state, year, start, time.perf_counter() - start, {"attempt": attempt + 1, "error": str(error), "delay": delay})
+		time.sleep(delay)
+		
+	if not __stats is None:
+		__stats.record("fetch", state, year, start, time.perf_counter() - start, {"bytes": len(content), "status": request.status_code})
+	
+	if cache_enabled:
+		def write(temp):
+			with open(temp, "wb") as f:
+				f.write(content)
+		__cache_write(path, write)
+	return content
+	
+	
+# private class that walks a datagraph page as a stream of tags and collects the county tables inside div.info,
+# without building a document tree
+class __DatagraphParser(HTMLParser):
+	def __init__(self):
+		HTMLParser.__init__(self, convert_charrefs=True)
+		self.tables = [] # list of tables, each a list of rows, each a list of cells [classes, text pieces, bold text]
+		self.depth = 0 # number of open divs inside div.info, 0 when outside of it
+		self.done = False
+		self.rows = None
+		self.cells = None
+		self.cell = None
+		self.bold = None
+
+	def handle_starttag(self, tag, attrs):
+		if self.done:
+			return
+		if tag == "div":
+			if self.depth > 0:
+				self.depth += 1
+			elif "info" in (dict(attrs).get("class") or "").split():
+				self.depth = 1
+		elif self.depth == 0:
+			return
+		elif tag == "table":
+			self.rows = []
+		elif tag == "tr" and not self.rows is None:
+			self.cells = []
+			self.cell = None
+			self.rows.append(self.cells)
+		elif tag == "td" and not self.cells is None:
+			self.cell = [(dict(attrs).get("class") or "").split(), [], None]
+			self.cells.append(self.cell)
+		elif tag == "b" and not self.cell is None and self.cell[2] is None:
+			self.bold = []
+
+	def handle_endtag(self, tag):
+		if self.done or self.depth == 0:
+			return
+		if tag == "div":
+			self.depth -= 1
+			self.done = self.depth == 0
+		elif tag == "table" and not self.rows is None:
+			if len(self.rows) > 0:
+				self.tables.append(self.rows)
+			self.rows = self.cells = self.cell = None
+		elif tag == "tr":
+			self.cells = self.cell = None
+		elif tag == "td":
+			self.cell = None
+		elif tag == "b" and not self.bold is None:
+			self.cell[2] = "".join(self.bold)
+			self.bold = None
+
+	def handle_data(self, data):
+		if not self.cell is None:
+			self.cell[1].append(data)
+			if not self.bold is None:
+				self.bold.append(data)
+
+# private method that decodes a page the way BeautifulSoup would: with the charset declared in the page if there is one,
+# otherwise as UTF-8 falling back to Windows-1252
+def __decode(content):
+	if isinstance(content, str):
+		return content
+	declared = re.search(rb'<meta[^>]+charset=["\']?([-\w]+)', content[:2048], re.IGNORECASE)
+	encodings = ["utf-8", "windows-1252"]
+	if not declared is None:
+		encodings.insert(0, declared.group(1).decode("ascii"))
+	for encoding in encodings:
+		try:
+			return content.decode(encoding)
+		except (UnicodeDecodeError, LookupError):
+			pass
+	return content.decode("windows-1252", errors="replace")
+
+# private method that returns the counties of a datagraph page using the streaming tokenizer
+def __fast_counties(content):
+	parser = __DatagraphParser()
+	parser.feed(__decode(content))
+	parser.close()
+
+	counties = []
+	for rows in parser.tables:
+		candidates = []
+		for cells in rows:
+			name = None
+			per = None
+			for (classes, text, _) in cells:
+				if name is None and "cnd" in classes:
+					name = "".join(text)
+				if per is None and "per" in classes:
+					per = "".join(text)
+			if name is None:
+				name = "".join(cells[0][1])
+			candidates.append((name, per))
+		counties.append((rows[0][0][2], candidates))
+	return counties
+
+# private method that returns the counties of a datagraph page using lxml
+def __lxml_counties(content):
+	import lxml.html
+	has_class = lambda c: 'td[contains(concat(" ", normalize-space(@class), " "), " ' + c + ' ")]'
+	root = lxml.html.fromstring(__decode(content))
+	info = root.xpath('//body//div[contains(concat(" ", normalize-space(@class), " "), " info ")]')[0]
+
+	counties = []
+	for table in info.iter("table"):
+		rows = list(table.iter("tr"))
+		if len(rows) == 0:
+			continue
+		candidates = []
+		for row in rows:
+			name = row.xpath(".//" + has_class("cnd"))
+			name = name[0] if len(name) > 0 else row.xpath(".//td")[0]
+			per = row.xpath(".//" + has_class("per"))[0]
+			candidates.append((name.text_content(), per.text_content()))
+		counties.append((rows[0].xpath(".//td")[0].find(".//b").text_content(), candidates))
+	return counties
+
+# private method that returns the counties of a datagraph page using BeautifulSoup. this is the reference parser
+# that the other backends must match. the strings are copied out of the document, since BeautifulSoup strings keep the
+# whole document alive and cannot be sent back from the parser processes
+def __bs4_counties(content):
+	from bs4 import BeautifulSoup
+	text = lambda string: None if string is None else str(string)
+	soup = BeautifulSoup(content, "html.parser")
+	tables = soup.body.find("div", {"class": "info"}).find_all("table") # list of tables, each table corresponding to a county
+
+	counties = []
+	for county in tables:
+		values = county.find_all("tr") # list of candidate rows for the county
+		candidates = []
 		for candidate in values:
 			name = candidate.find("td", {"class":"cnd"})
 			if name is None:
 				name = candidate.find("td").string
 			else:
 				name = name.string
-				
-			candidate_results[name] = __percent(candidate.find("td", {"class":"per"}).string)
-			all_candidates[name] = None
-			
-		results[county_name] = candidate_results
+			candidates.append((text(name), text(candidate.find("td", {"class":"per"}).string)))
+		counties.append((text(values[0].find("td").b.string), candidates))
+	return counties
+
+
+# compact container of the county results of one election, which is what the parser, the caches and the store hold.
+# row i is the county with FIPS code fips[i] and display name counties[i], and column j is the candidate candidates[j].
+# only the names of counties that the county index does not give are kept, and the others are looked up in the index.
+# percents holds every percent as float32, with the column of each candidate contiguous, and missing marks the
+# candidates that were not on a county's ballot, whose percents are 0. a container is shared by everything that loads
+# its election from the memory cache, so its arrays are read only, and frame returns the DataFrame of election_results
+# as a copy that callers are free to change
+class CountyResults:
+	def __init__(self, fips, counties, candidates, percents, missing):
+		self.fips = fips # int64 array
+		self.names = {i: counties[i] for i in range(len(fips)) if county_display(int(fips[i])) != counties[i]} # row -> display name
+		self.candidates = candidates # list of candidate names
+		self.percents = percents # float32 array, counties x candidates, in column order
+		self.missing = missing # bool array, counties x candidates, in column order
+		for array in [fips, percents, missing]:
+			array.flags.writeable = False
+		
+	def __len__(self):
+		return len(self.fips)
+		
+	# the list of display names of the counties, in row order
+	@property
+	def counties(self):
+		return [self.names[i] if i in self.names else county_display(key) for (i, key) in enumerate(self.fips.tolist())]
 		
+	# containers are pickled with every name, and loaded through __init__ so the arrays are read only again
+	def __getstate__(self):
+		return {"fips": self.fips, "counties": self.counties, "candidates": self.candidates, "percents": self.percents, "missing": self.missing}
+		
+	def __setstate__(self, state):
+		self.__init__(state["fips"], state["counties"], state["candidates"], state["percents"], state["missing"])
+		
+	# returns a new pandas DataFrame indexed by FIPS code with a County column and a "<candidate> %" column for each
+	# candidate. the percents are float64, rounded back to the two decimals shown on the atlas
+	def frame(self):
+		import numpy as np
+		import pandas as pd
+		results = pd.DataFrame(np.round(self.percents.astype(float), 2), index=pd.Index(self.fips, name="FIPS"), \
+		columns=[cand + " %" for cand in self.candidates])
+		results.insert(0, "County", self.counties)
+		return results
+		
+	# returns the number of bytes used by the arrays and the names the container keeps
+	def memory_usage(self):
+		import sys
+		names = sum([sys.getsizeof(name) for name in list(self.names.values()) + self.candidates])
+		return self.fips.nbytes + self.percents.nbytes + self.missing.nbytes + names + sys.getsizeof(self.names) + sys.getsizeof(self.candidates)
+		
+		
+# private method that returns columns of election results as a float64 array with the percents rounded back to their two
+# decimals, so that the float32 percents of a CountyResults give exactly the values shown on the atlas
+def __percent_values(results, columns=None):
+	import numpy as np
+	values = results.iloc[:, 1:] if columns is None else results[columns]
+	return np.round(values.to_numpy(dtype=float), 2)
+	
+# private method that parses a datagraph page into a CountyResults with county level data for the election, using the
+# given parser backend (see parser_backend)
+def __parse_page(content, state, backend):
+	import numpy as np
+	if backend == "bs4":
+		counties = __bs4_counties(content)
+	elif backend == "lxml":
+		counties = __lxml_counties(content)
+	else:
+		counties = __fast_counties(content)
+
 	'''
-	Current data format for results
-	{
-	county_name:
-		{Candidate: percentage, Candidate: percentage, etc},
-	county_name:
-		{Candidate: percentage, Candidate: percentage, etc},
-	county_name:
-		{Candidate: percentage, Candidate: percentage, etc},
+	Current data format for counties
+	[
+	(county_name, [(Candidate, percentage string), (Candidate, percentage string), etc]),
 	etc
-	}
+	]
 	'''
+
+	keys = [] # FIPS code of each county
+	names = [] # display name of each county
+	codes = {} # column of every candidate on the ballot in this state, in the order they appear
+	cells = [] # (county row, candidate column, percent) of every result
+	
+	# add the value for every county individually
+	for (county_name, values) in counties:
+		key = county_fips(state, county_name, keys)
+		keys.append(key)
+		names.append(county_display(key, county_name))
+		for (name, percent) in values:
+			cells.append((len(keys) - 1, codes.setdefault(name, len(codes)), __percent(percent)))
+			
+	# place the results in column order arrays, marking the candidates that are not in a county as missing
+	percents = np.zeros((len(keys), len(codes)), dtype=np.float32, order="F")
+	missing = np.ones((len(keys), len(codes)), dtype=bool, order="F")
+	if len(cells) > 0:
+		rows, columns, values = zip(*cells)
+		percents[rows, columns] = values
+		missing[rows, columns] = False
+	return CountyResults(np.array(keys, dtype=np.int64), names, list(codes.keys()), percents, missing)
+	
+	
+# private method that parses a page and returns the DataFrame along with the seconds spent parsing. this runs in the
+# parser processes of fetch_results, so only the finished table is sent back. the backend is passed in rather than read
+# from parser_backend, since processes that are spawned rather than forked do not see changes to the module variables
+def __timed_parse(content, state, backend):
+	start = time.perf_counter()
+	results = __parse_page(content, state, backend)
+	return (results, time.perf_counter() - start)
+	
+# private method that records the parse of a page, which took the given seconds and ended now
+def __record_parse(state, year, results, seconds):
+	if not __stats is None:
+		__stats.record("parse", state, year, time.perf_counter() - seconds, seconds, {"rows": len(results)})
+	
+# private method that returns the stored or cached DataFrame for a state and year, or None if it is not available locally
+def __cached_table(state, year):
+	if not __batch_tables is None and (state, year) in __batch_tables:
+		return __batch_tables[(state, year)]
+		
+	start = time.perf_counter()
+	if memory_size > 0:
+		with __memory_lock:
+			results = __memory_tables.get((state, year))
+			if not results is None:
+				__memory_tables.move_to_end((state, year))
+		if not results is None:
+			if not __stats is None:
+				__stats.record("cache", state, year, start, time.perf_counter() - start, {"tier": "memory", "hit": True, "rows": len(results)})
+			return results
+			
+	if not store_dir is None:
+		path = __store_path(state, year)
+		if os.path.isfile(path):
+			results = __read_partition(path)
+			__remember_table(state, year, results)
+			if not __stats is None:
+				__stats.record("cache", state, year, start, time.perf_counter() - start, {"tier": "store", "hit": True, "rows": len(results)})
+			return results
+			
+	path = __cache_path("tables", state, year)
+	if cache_enabled and os.path.isfile(path):
+		__cache_touch(path)
+		try:
+			with open(path, "rb") as f:
+				results = pickle.load(f)
+		except (pickle.UnpicklingError, AttributeError, EOFError, ImportError, FileNotFoundError): # unreadable or evicted tables are parsed again
+			results = None
+		if isinstance(results, CountyResults): # tables cached as DataFrames by older versions are parsed again
+			__remember_table(state, year, results)
+			if not __stats is None:
+				__stats.record("cache", state, year, start, time.perf_counter() - start, {"tier": "tables", "hit": True, "rows": len(results)})
+			return results
+	if not __stats is None and cache_enabled:
+		__stats.record("cache", state, year, start, time.perf_counter() - start, {"tier": "tables", "hit": False})
+	return None
+	
+# private method that keeps a table in memory, if memory_size allows, dropping the least recently used tables
+def __remember_table(state, year, results):
+	if memory_size > 0:
+		with __memory_lock:
+			__memory_tables[(state, year)] = results
+			__memory_tables.move_to_end((state, year))
+			while len(__memory_tables) > memory_size:
+				__memory_tables.popitem(last=False)
+				
+# private method that stores a parsed DataFrame in memory and in the cache
+def __store_table(state, year, results):
+	__remember_table(state, year, results)
+	if cache_enabled:
+		def write(temp):
+			with open(temp, "wb") as f:
+				pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+		__cache_write(__cache_path("tables", state, year), write)
+		
+
+# private method that returns the path of the store partition for a state and year
+def __store_path(state, year):
+	return os.path.join(store_dir, "year=" + str(year), "fips=" + str(fips[state]), "part.parquet")
+	
+# private method that writes a DataFrame from election_results to a store partition in long form, with one row per
+# county and candidate. county and candidate are stored as categoricals in their original order
+def __write_partition(path, results):
+	import numpy as np
+	import pandas as pd
+	import pyarrow as pa
+	# every partition uses the same dictionary index type so the dataset can be read as a whole
+	schema = pa.schema([("FIPS", pa.int32()), ("County", pa.dictionary(pa.int32(), pa.string())), \
+	("Candidate", pa.dictionary(pa.int32(), pa.string())), ("Percent", pa.float64())])
+	rows, cols = np.nonzero(~results.missing) # only the candidates on each county's ballot are written
+	
+	table = pd.DataFrame({
+		"FIPS": results.fips[rows],
+		"County": pd.Categorical.from_codes(rows, categories=results.counties),
+		"Candidate": pd.Categorical.from_codes(cols, categories=results.candidates),
+		"Percent": np.round(results.percents[rows, cols].astype(float), 2)})
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	temp = os.path.join(os.path.dirname(path), "." + str(threading.get_ident()) + ".tmp") # hidden from dataset readers
+	table.to_parquet(temp, index=False, schema=schema)
+	os.replace(temp, path)
+	
+# private method that reads a store partition back into a CountyResults
+def __read_partition(path):
+	import numpy as np
+	import pandas as pd
+	table = pd.read_parquet(path, columns=["FIPS", "County", "Candidate", "Percent"])
+	counties = table["County"].cat
+	candidates = table["Candidate"].cat
+	
+	shape = (len(counties.categories), len(candidates.categories))
+	percents = np.zeros(shape, dtype=np.float32, order="F")
+	missing = np.ones(shape, dtype=bool, order="F")
+	percents[counties.codes, candidates.codes] = table["Percent"].to_numpy()
+	missing[counties.codes, candidates.codes] = False
+	keys = np.zeros(shape[0], dtype=np.int64)
+	keys[counties.codes] = table["FIPS"].to_numpy()
+	return CountyResults(keys, list(counties.categories), list(candidates.categories), percents, missing)
+	
+# private method that loads the manifest of the store, which maps "<year>/<fips>" to the page hash and size of each partition
+def __read_manifest():
+	path = os.path.join(store_dir, "_manifest.json")
+	if not os.path.isfile(path):
+		return {}
+	with open(path) as f:
+		return json.load(f)
+		
+# private method that saves the manifest of the store
+def __write_manifest(manifest):
+	path = os.path.join(store_dir, "_manifest.json")
+	os.makedirs(store_dir, exist_ok=True)
+	with open(path + ".tmp", "w") as f:
+		json.dump(manifest, f, indent=1, sort_keys=True)
+	os.replace(path + ".tmp", path)
+	
+
+# returns a pandas DataFrame with county level data for the election. the DataFrame is a copy of the CountyResults the
+# election is kept in, with the percents as float64 rounded to two decimals
+def election_results(state, year):
+	results = __cached_table(state, year)
+	if results is None:
+		results, seconds = __timed_parse(__fetch_page(state, year), state, parser_backend)
+		__record_parse(state, year, results, seconds)
+		__store_table(state, year, results)
+	return results.frame()
+	
+
+# private method that loads one election for fetch_results and iter_results. the table is taken from the store or cache
+# when possible, and otherwise the page is downloaded and either parsed in this thread or handed to the parser processes
+# if parsers is given. returns the table (or None and the future of the parse) and the seconds spent fetching and parsing
+def __load(state, year, parsers):
+	results = __cached_table(state, year)
+	if not results is None:
+		return (results, None, 0.0, 0.0)
+		
+	start = time.perf_counter()
+	content = __fetch_page(state, year)
+	fetch = time.perf_counter() - start
+	if parsers is None:
+		results, seconds = __timed_parse(content, state, parser_backend)
+		__record_parse(state, year, results, seconds)
+		__store_table(state, year, results)
+		return (results, None, fetch, seconds)
+	return (None, parsers.submit(__timed_parse, content, state, parser_backend), fetch, 0.0)
+	
+# private method that waits for a page handed to the parser processes and stores its table. returns the table and the
+# seconds spent parsing
+def __finish_load(state, year, parse):
+	results, seconds = parse.result()
+	__record_parse(state, year, results, seconds)
+	__store_table(state, year, results)
+	return (results, seconds)
+	
+
+# private method that starts a pool of parser processes, or returns None if processes is 0. multiprocessing is only
+# imported when parse_processes is used
+def __parser_pool(processes):
+	if processes == 0:
+		return None
+	from concurrent.futures import ProcessPoolExecutor
+	return ProcessPoolExecutor(max_workers=processes)
+	
+
+# returns a list of DataFrames with county level data for each (state, year) pair in loads, in the same order.
+# the pages are downloaded in parallel, and if parse_processes is set they are parsed in a pool of processes while the
+# remaining downloads continue. if a stats dictionary is given, it is filled with the busy seconds, worker count and
+# utilization of the fetch and parse stages and the total wall time
+def fetch_results(loads, stats=None):
+	return [results.frame() for results in __fetch_tables(loads, stats)]
+	
+# private method that does the work of fetch_results, returning the CountyResults of each load
+def __fetch_tables(loads, stats=None):
+	start = time.perf_counter()
+	threads = max(1, min(max_workers, len(loads)))
+	processes = parse_processes if parse_processes else 0
+	busy = {"fetch": 0.0, "parse": 0.0} # seconds spent working in each stage
+	lock = threading.Lock()
+	
+	# load a table, adding the time spent in each stage of this thread to the busy totals
+	def load(i, parsers):
+		results, parse, fetch, seconds = __load(loads[i][0], loads[i][1], parsers)
+		with lock:
+			busy["fetch"] += fetch
+			busy["parse"] += seconds
+		return (results, parse)
+		
+	parsers = __parser_pool(processes)
+	try:
+		if threads == 1 and parsers is None:
+			loaded = [load(i, None) for i in range(len(loads))]
+		else:
+			with ThreadPoolExecutor(max_workers=threads) as pool:
+				loaded = list(pool.map(lambda i: load(i, parsers), range(len(loads))))
+				
+		results = []
+		for i in range(len(loads)):
+			table, parse = loaded[i]
+			if not parse is None: # wait for the parser processes
+				table, seconds = __finish_load(loads[i][0], loads[i][1], parse)
+				busy["parse"] += seconds
+			results.append(table)
+	finally:
+		if not parsers is None:
+			parsers.shutdown()
+			
+	if not stats is None:
+		wall = time.perf_counter() - start
+		stats["wall"] = wall
+		for (stage, workers) in [("fetch", threads), ("parse", processes if processes > 0 else threads)]:
+			stats[stage] = {"busy": busy[stage], "workers": workers, \
+			"utilization": busy[stage] / (wall * workers) if wall > 0 else 0.0}
+	return results
+	
+# yields a (state, year, DataFrame) tuple for each (state, year) pair in loads, in the same order, as soon as each one
+# is ready. up to max_workers pages are downloaded ahead of the one being used, so only a few tables are in memory at a
+# time no matter how many loads there are, and the first can be used before the last has been downloaded
+def iter_results(loads):
+	for (state, year, results) in __iter_tables(loads):
+		yield (state, year, results.frame())
+		
+# private method that does the work of iter_results, yielding the CountyResults of each load
+def __iter_tables(loads):
+	loads = list(loads)
+	window = max(1, max_workers)
+	processes = parse_processes if parse_processes else 0
+	parsers = __parser_pool(processes)
+	try:
+		with ThreadPoolExecutor(max_workers=window) as pool:
+			pending = [] # loads that have been started but not yet yielded, in order
+			i = 0
+			while i < len(loads) or len(pending) > 0:
+				while i < len(loads) and len(pending) < window:
+					pending.append(pool.submit(__load, loads[i][0], loads[i][1], parsers))
+					i += 1
+				state, year = loads[i - len(pending)]
+				results, parse, _, _ = pending.pop(0).result()
+				if not parse is None: # wait for the parser processes
+					results, _ = __finish_load(state, year, parse)
+				yield (state, year, results)
+	finally:
+		if not parsers is None:
+			parsers.shutdown()
+			
+# yields one record for every county of every (state, year) pair in loads, as each page is parsed (see iter_results).
+# each record is a (state, year, FIPS, county, candidates, percents, missing) tuple, where candidates is the tuple of
+# candidate names shared by every county of the election, percents is a float32 numpy array of their percents in the
+# same order and missing marks the candidates that were not on the county's ballot
+def iter_counties(loads):
+	for (state, year, results) in __iter_tables(loads):
+		candidates = tuple(results.candidates)
+		counties = results.counties
+		percents = results.percents.copy(order="C") # one contiguous row per county
+		missing = results.missing.copy(order="C")
+		for i in range(len(results)):
+			yield (state, year, int(results.fips[i]), counties[i], candidates, percents[i], missing[i])
+		
 		
-	# return results in the form of a DataFrame
-	df = {"County": results.keys()}
-	for candidate in all_candidates.keys(): # for every candidate
-		df[candidate + " %"] = [results[county][candidate] for county in results.keys()]
+# loads every (state, year) pair in loads into the cache without stopping at pairs that fail. if a checkpoint_file is given, the pairs that have been loaded and the errors of the pairs that failed are saved
+# there as they finish, and a crawl that is run again with the same checkpoint_file only loads the remaining pairs.
+# returns the list of pairs that failed
+def crawl(loads, checkpoint_file=None):
+	if not cache_enabled:
+		raise ValueError("crawl keeps its tables in the cache, so cache_enabled must be set")
 		
-	return pd.DataFrame(df)
+	done = set()
+	failed = {} # maps each pair that failed to its error
+	if not checkpoint_file is None and os.path.isfile(checkpoint_file):
+		with open(checkpoint_file) as f:
+			checkpoint = json.load(f)
+		done = set([(state, year) for (state, year) in checkpoint["done"]])
+	remaining = [load for load in dict.fromkeys([tuple(load) for load in loads]) if not load in done]
+	
+	# save the loaded and failed pairs, replacing the old checkpoint only once the new one is complete
+	def save():
+		with open(checkpoint_file + ".tmp", "w") as f:
+			json.dump({"done": sorted(done, key=lambda load: (load[1], load[0])), \
+			"failed": [[state, year, error] for ((state, year), error) in failed.items()]}, f, indent=1)
+		os.replace(checkpoint_file + ".tmp", checkpoint_file)
+		
+	with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(remaining)))) as pool:
+		futures = {pool.submit(election_results, state, year): (state, year) for (state, year) in remaining}
+		for future in as_completed(futures):
+			try:
+				future.result()
+				done.add(futures[future])
+			except Exception as e:
+				failed[futures[future]] = str(e)
+			if not checkpoint_file is None:
+				save()
+				
+	if len(failed) == 0:
+		__print("blue", "Success! " + str(len(remaining)) + " elections have been loaded.")
+	for ((state, year), error) in failed.items():
+		__print("orange", "Warning: " + state + " " + str(year) + " could not be loaded: " + error)
+	return [load for load in remaining if load in failed]
 	
 
-# # returns a pandas DataFrame with county level data for swings between election years in a state
+# collects every state in states (all states by default) for every year in years into the columnar store at store_dir,
+# which must be set first. elections already in the manifest are skipped, unless refresh is True, in which case every page
+# is downloaded again and only the partitions whose page changed are rewritten. returns the lists of (state, year) pairs
+# that were written and that were left unchanged
+def build_store(years, states=None, refresh=False):
+	import hashlib
+	if store_dir is None:
+		raise ValueError("store_dir must be set before building the store")
+	if states is None:
+		states = list(fips.keys())
+	elif not type(states) is list:
+		states = [states]
+		
+	manifest = __read_manifest()
+	key = lambda state, year: str(year) + "/" + str(fips[state])
+	loads = [(state, year) for year in years for state in states if refresh or not key(state, year) in manifest]
+	
+	# download, parse and write one partition, returning its manifest entry or None if the page has not changed
+	def build(load):
+		state, year = load
+		content = __fetch_page(state, year, fresh=refresh)
+		digest = hashlib.sha1(content).hexdigest()
+		entry = manifest.get(key(state, year))
+		if not entry is None and entry["sha1"] == digest and os.path.isfile(__store_path(state, year)):
+			return None
+			
+		results, seconds = __timed_parse(content, state, parser_backend)
+		__record_parse(state, year, results, seconds)
+		__write_partition(__store_path(state, year), results)
+		return {"state": state, "year": year, "sha1": digest, "counties": len(results), "candidates": len(results.candidates)}
+		
+	written = []
+	unchanged = []
+	try:
+		with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(loads)))) as pool:
+			for (load, entry) in zip(loads, pool.map(build, loads)):
+				if entry is None:
+					unchanged.append(load)
+				else:
+					manifest[key(load[0], load[1])] = entry
+					written.append(load)
+	finally:
+		__write_manifest(manifest)
+		
+	return (written, unchanged)
+	
+
+# returns the whole store, or the given states and years of it, as one long pandas DataFrame with County, Candidate,
+# Percent, year and fips columns
+def read_store(years=None, states=None):
+	import pandas as pd
+	filters = []
+	if not years is None:
+		filters.append(("year", "in", list(years)))
+	if not states is None:
+		if not type(states) is list:
+			states = [states]
+		filters.append(("fips", "in", [fips[state] for state in states]))
+	return pd.read_parquet(store_dir, filters=filters if len(filters) > 0 else None)
+	
+
+__party_warnings = set() # (year, candidates) already warned about by __party_columns, so each table warns once
+
+# private method that returns the Democratic and Republican columns of an election's results, looking the nominees of the
+# year up by name. a nominee that is not on the ballot gives None for their party. if neither nominee can be found the
+# first two candidate columns are used, or None where the table has fewer than two. a warning is printed unless both match
+def __party_columns(results, year):
+	columns = list(results.columns[1:])
+	found = []
+	for nominee in nominees.get(year, ()):
+		matches = [c for c in columns if nominee.lower() in c.lower()]
+		found.append(matches[0] if len(matches) > 0 else None)
+		
+	if len(found) == 2 and found[0] != found[1] and not found[0] is None and not found[1] is None:
+		return (found[0], found[1])
+	if len(found) == 2 and found != [None, None] and found[0] != found[1]:
+		message = "the " + str(year) + " nominee " + nominees[year][found.index(None)] + " is not among the candidates " + \
+		", ".join([c[:-2] for c in columns]) + ", so their party is left empty."
+	else:
+		found = (columns + [None, None])[:2]
+		message = ("no nominees are known for " + str(year) if not year in nominees else "the " + str(year) + " nominees " + \
+		" and ".join(nominees[year]) + " could not be matched") + ", so of the candidates " + ", ".join([c[:-2] for c in columns]) + \
+		(" the first two are used as the Democrat and Republican." if len(columns) > 1 else " the first is used as the Democrat.")
+	key = (year, tuple(columns))
+	if not key in __party_warnings:
+		__party_warnings.add(key)
+		__print("orange", "Warning: " + message)
+	return (found[0], found[1])
+	
+# private method that returns the Democratic and Republican percentages of every county as an array of two columns. a
+# party with no column (see __party_columns) is NaN
+def __party_values(results, year):
+	import numpy as np
+	values = np.full((len(results), 2), np.nan)
+	for (i, column) in enumerate(__party_columns(results, year)):
+		if not column is None:
+			values[:, i] = __percent_values(results, [column])[:, 0]
+	return values
+	
+# private method that returns the Democratic minus Republican margin of every county as a Series indexed by county
+def __party_margin(results, year):
+	import pandas as pd
+	values = __party_values(results, year)
+	return pd.Series(values[:, 0] - values[:, 1], index=results.index)
+	
+# private method that combines the results of two elections and computes the swing between them. counties are matched
+# by FIPS code, so a county that was renamed between elections stays on one row under its later name
+def __swings(results1, results2, year1, year2):
+	start = time.perf_counter()
+	results = results1.drop(columns="County").merge(results2.drop(columns="County"), left_index=True, right_index=True, how="outer")
+	results.insert(0, "County", results2["County"].combine_first(results1["County"]).reindex(results.index))
+	results = results.sort_values("County", kind="stable")
+	
+	# a positive swing is a shift in margin towards Democrats
+	results["Swing"] = __party_margin(results2, year2).reindex(results.index) - __party_margin(results1, year1).reindex(results.index)
+	if not __stats is None:
+		__stats.record("swing", None, None, start, time.perf_counter() - start, {"rows": len(results), "years": [year1, year2]})
+	return results
+	
+
+# returns a pandas DataFrame with the swings between two DataFrames of election results for the same state, such as
+# those returned by election_results or fetch_results for year1 and year2
+def results_swings(results1, results2, year1, year2):
+	return __swings(results1, results2, year1, year2)
+	
+# returns a pandas DataFrame indexed by FIPS code with the County, Winner (None for a tie), Margin and margin Level
+# (0 for a margin under 10%, 1 under 20%, 2 under 30% and 3 otherwise) of every county in a DataFrame of election results
+def classify_results(results):
+	import pandas as pd
+	names = [cand[:-2] for cand in results.columns[1:]]
+	winners, margins, levels, ties = __margins(results)
+	return pd.DataFrame({"County": results["County"], "Winner": [None if ties[r] else names[winners[r]] for r in range(len(results))], \
+	"Margin": margins, "Level": levels}, index=results.index)
+	
+# returns a pandas DataFrame with county level data for swings between election years in a state
 def election_swings(state, year1, year2):
-	results1 = election_results(state, year1)
-	results2 = election_results(state, year2)
-	results = results1.merge(results2, on="County", how="outer")
-	candidates = results.columns
+	results1, results2 = fetch_results([(state, year1), (state, year2)])
+	return __swings(results1, results2, year1, year2)
+	
+	
+# returns a list of swing DataFrames for each state in states, in the same order. all pages are downloaded in parallel
+def fetch_swings(states, year1, year2):
+	results = fetch_results([(state, year) for state in states for year in [year1, year2]])
+	return [__swings(results[2*i], results[2*i + 1], year1, year2) for i in range(len(states))]
+	
+# yields a (state, DataFrame) tuple with the swings of each state in states, in the same order, as soon as both of its
+# elections are ready (see iter_results)
+def iter_swings(states, year1, year2):
+	results = iter_results([(state, year) for state in states for year in [year1, year2]])
+	for (state, _, results1) in results:
+		_, _, results2 = next(results)
+		yield (state, __swings(results1, results2, year1, year2))
+	
+
+# returns a pandas DataFrame with one row per county (matched between elections by FIPS code) and the Democratic %,
+# Republican % and margin of every election in years, with the major party columns matched by party rather than by
+# position. states can be a list or a single state. each election is loaded once, and the panel can be passed to
+# panel_swings for any number of swings
+def election_panel(states, years):
+	import pandas as pd
+	if not type(states) is list:
+		states = [states]
+	years = sorted(years)
+	results = fetch_results([(state, year) for state in states for year in years])
+	
+	panels = []
+	for s in range(len(states)):
+		columns = {}
+		names = None # latest display name of every county
+		for y in range(len(years)):
+			table = results[s * len(years) + y]
+			values = __party_values(table, years[y])
+			columns[str(years[y]) + " D %"] = pd.Series(values[:, 0], index=table.index)
+			columns[str(years[y]) + " R %"] = pd.Series(values[:, 1], index=table.index)
+			columns[str(years[y]) + " Margin"] = pd.Series(values[:, 0] - values[:, 1], index=table.index)
+			names = table["County"] if names is None else table["County"].combine_first(names)
+			
+		panel = pd.concat(columns, axis=1, join="outer") # counties missing from an election are left as NaN
+		panel.insert(0, "County", names.reindex(panel.index))
+		panel = panel.reset_index()
+		panel.insert(0, "State", states[s])
+		panels.append(panel)
+		
+	return pd.concat(panels, ignore_index=True)
+	
+
+# returns a pandas DataFrame with the swing between elections for every county in a panel from election_panel.
+# by default the swings are between consecutive elections. pairs can instead be a list of (year1, year2) tuples, or
+# "all" for every pair of elections. a positive swing is a shift towards Democrats
+def panel_swings(panel, pairs=None):
+	years = [int(c[:-len(" Margin")]) for c in panel.columns if c.endswith(" Margin")]
+	margins = panel[[str(y) + " Margin" for y in years]].to_numpy(dtype=float) # counties x elections
+	position = {years[i]: i for i in range(len(years))}
+	
+	if pairs is None:
+		pairs = [(years[i], years[i + 1]) for i in range(len(years) - 1)]
+	elif pairs == "all":
+		pairs = [(years[i], years[j]) for i in range(len(years)) for j in range(i + 1, len(years))]
+		
+	first = [position[p[0]] for p in pairs]
+	second = [position[p[1]] for p in pairs]
+	swings = margins[:, second] - margins[:, first]
+	
+	results = panel[["State", "FIPS", "County"]].copy()
+	for i in range(len(pairs)):
+		results[str(pairs[i][0]) + " > " + str(pairs[i][1]) + " Swing"] = swings[:, i]
+	return results
+	
+
+# private method that returns the arrays an election adds to an index: county FIPS codes, names, the party of each
+# winner (0 Democrat, 1 Republican, 2 another candidate, -1 a tie), the Democratic minus Republican margin and the
+# Democratic share of the two party vote
+def __index_arrays(results, year):
+	import numpy as np
+	dem, rep = __party_columns(results, year)
+	winners, _, ties = __winners(results)
+	columns = list(results.columns[1:])
+	party = np.full(len(columns), 2, dtype=np.int8)
+	for (i, column) in enumerate([dem, rep]):
+		if not column is None:
+			party[columns.index(column)] = i
+			
+	d, r = __party_values(results, year).T
+	with np.errstate(invalid="ignore", divide="ignore"):
+		share = 100 * d / (d + r)
+	winner = np.where(ties, -1, party[np.maximum(winners, 0)]).astype(np.int8)
+	return (results.index.to_numpy(dtype=np.int64), list(results["County"]), winner, (d - r).astype(np.float32), share.astype(np.float32))
+	
+# returns an index of every county in states over every election in years, for flip, streak, bellwether and swing
+# queries. the index is a dictionary of compact arrays with a row for each county (matched between elections by FIPS
+# code) and a column for each year, in order: "winner" holds the party of each county's winner (0 Democrat, 1 Republican,
+# 2 another candidate, -1 a tie or no result), "margin" the Democratic minus Republican margin and "share" the Democratic
+# share of the two party vote. "fips", "state" and "county" (the latest name) describe the rows and "years" the columns,
+# and "elections" holds the (state, year) pairs that have been added. if an index is given, only the elections it does
+# not have yet are loaded and added to it, and the updated index is returned
+def build_index(states, years, index=None):
+	import numpy as np
+	if not type(states) is list:
+		states = [states]
+	if index is None:
+		index = {"years": [], "fips": np.zeros(0, dtype=np.int64), "state": [], "county": [], "winner": np.zeros((0, 0), dtype=np.int8), \
+		"margin": np.zeros((0, 0), dtype=np.float32), "share": np.zeros((0, 0), dtype=np.float32), "elections": set(), "named": []}
+		
+	# each election is reduced to its arrays as it arrives, so the full tables are never all in memory
+	loads = [(state, year) for year in years for state in states if not (state, year) in index["elections"]]
+	parts = [(state, year) + __index_arrays(results, year) for (state, year, results) in iter_results(loads)]
+	
+	# grow the arrays once for every new county and year
+	rows = {index["fips"][i]: i for i in range(len(index["fips"]))}
+	fips_codes = list(index["fips"])
+	for (state, _, keys, counties, _, _, _) in parts:
+		for i in range(len(keys)):
+			if not keys[i] in rows:
+				rows[keys[i]] = len(fips_codes)
+				fips_codes.append(keys[i])
+				index["state"].append(state)
+				index["county"].append(counties[i])
+				index["named"].append(0)
+	all_years = sorted(set(index["years"]) | set([part[1] for part in parts]))
+	old = [all_years.index(year) for year in index["years"]]
+	for (name, fill) in [("winner", -1), ("margin", np.nan), ("share", np.nan)]:
+		grown = np.full((len(fips_codes), len(all_years)), fill, dtype=index[name].dtype)
+		grown[:index[name].shape[0], old] = index[name]
+		index[name] = grown
+		
+	for (state, year, keys, counties, winner, margin, share) in parts:
+		positions = np.array([rows[key] for key in keys], dtype=np.int64)
+		column = all_years.index(year)
+		index["winner"][positions, column] = winner
+		index["margin"][positions, column] = margin
+		index["share"][positions, column] = share
+		for i in range(len(keys)): # counties keep the name of their latest election
+			if year >= index["named"][positions[i]]:
+				index["county"][positions[i]] = counties[i]
+				index["named"][positions[i]] = year
+		index["elections"].add((state, year))
+		
+	index["fips"] = np.array(fips_codes, dtype=np.int64)
+	index["years"] = all_years
+	return index
+	
+# private method that returns the columns of an index for the years in years, or every year from since on
+def __index_columns(index, years=None, since=None):
+	if years is None:
+		years = [year for year in index["years"] if since is None or year >= since]
+	for year in years:
+		if not year in index["years"]:
+			raise ValueError(str(year) + " is not in the index, which has " + ", ".join([str(y) for y in index["years"]]))
+	return [index["years"].index(year) for year in years]
+	
+# private method that returns the State, FIPS and County columns of rows of an index as a dictionary
+def __index_rows(index, rows):
+	return {"State": [index["state"][r] for r in rows], "FIPS": index["fips"][rows], "County": [index["county"][r] for r in rows]}
+	
+# returns a pandas DataFrame with every county whose winning party changed between consecutive elections in an index,
+# one row per flip. by default every election is used, or only those from since on. if year1 or year2 is given, only
+# flips between those two elections are returned, with a missing year1 being the first election (from since on) and a
+# missing year2 the last
+def index_flips(index, since=None, year1=None, year2=None):
+	import numpy as np
+	import pandas as pd
+	years = None
+	if not year1 is None or not year2 is None:
+		available = [year for year in index["years"] if since is None or year >= since]
+		years = [available[0] if year1 is None and len(available) > 0 else year1, index["years"][-1] if year2 is None else year2]
+	columns = __index_columns(index, years, since)
+	winners = index["winner"][:, columns]
+	flipped = (winners[:, 1:] != winners[:, :-1]) & (winners[:, 1:] >= 0) & (winners[:, :-1] >= 0)
+	rows, pairs = np.nonzero(flipped)
+	
+	years = [index["years"][c] for c in columns]
+	names = np.array(["D", "R", "Other"])
+	results = pd.DataFrame(__index_rows(index, rows))
+	results["Year1"] = np.array(years)[pairs]
+	results["Year2"] = np.array(years)[pairs + 1]
+	results["From"] = names[winners[rows, pairs]]
+	results["To"] = names[winners[rows, pairs + 1]]
+	return results
+	
+# returns a pandas DataFrame with the longest run of consecutive elections in an index won by the same party in every
+# county, longest first. by default every election is used, or only those from since on
+def index_streaks(index, since=None):
+	import numpy as np
+	import pandas as pd
+	columns = __index_columns(index, since=since)
+	winners = index["winner"][:, columns]
+	years = np.array([index["years"][c] for c in columns], dtype=np.int64)
+	
+	# the length of the current run is carried across the elections for every county at once
+	run = (winners[:, 0] >= 0).astype(np.int32) if len(columns) > 0 else np.zeros(len(winners), dtype=np.int32)
+	best = run.copy()
+	end = np.zeros(len(winners), dtype=np.int32)
+	for c in range(1, len(columns)):
+		same = (winners[:, c] == winners[:, c - 1]) & (winners[:, c] >= 0)
+		run = np.where(same, run + 1, (winners[:, c] >= 0).astype(np.int32))
+		longer = run > best
+		best = np.where(longer, run, best)
+		end = np.where(longer, c, end)
+		
+	# counties that were a tie or had no result in every election have no streak
+	rows = np.nonzero(best > 0)[0]
+	best = best[rows]
+	end = end[rows]
+	results = pd.DataFrame(__index_rows(index, rows))
+	results["Party"] = np.array(["D", "R", "Other"])[winners[rows, end]]
+	results["Streak"] = best
+	results["From"] = years[end - best + 1]
+	results["To"] = years[end]
+	return results.sort_values("Streak", ascending=False, kind="stable").reset_index(drop=True)
+	
+# returns a pandas DataFrame with how often every county in an index voted for the national winner (national_winners),
+# most often first. by default every election is used, or only those from since on. counties that missed the national
+# winner more than misses times are left out
+def index_bellwethers(index, since=None, misses=0):
+	import numpy as np
+	import pandas as pd
+	columns = [c for c in __index_columns(index, since=since) if index["years"][c] in national_winners]
+	winners = index["winner"][:, columns]
+	national = np.array([national_winners[index["years"][c]] for c in columns], dtype=np.int8)
+	
+	voted = winners >= 0
+	matches = ((winners == national) & voted).sum(axis=1)
+	elections = voted.sum(axis=1)
+	keep = np.nonzero((elections > 0) & (elections - matches <= misses))[0]
 	
-	# calculate swing
-	swing = []
-	for i in range(len(results)):
-		swing += [(results[candidates[len(results1.columns)]][i] - results[candidates[len(results1.columns) + 1]][i]) - (results[candidates[1]][i] - results[candidates[2]][i])]
-	results["Swing"] = swing
+	results = pd.DataFrame(__index_rows(index, keep))
+	results["Matches"] = matches[keep]
+	results["Elections"] = elections[keep]
+	results["Rate"] = 100 * matches[keep] / elections[keep]
+	return results.sort_values(["Rate", "Elections"], ascending=False, kind="stable").reset_index(drop=True)
 	
+# returns a pandas DataFrame with the n counties in an index with the largest swing between two elections, largest
+# first. toward can be "D" or "R" for the largest swings towards one party, or None for the largest in either direction.
+# a positive swing is a shift towards Democrats
+def index_top_swings(index, year1, year2, n=10, toward=None):
+	import numpy as np
+	import pandas as pd
+	column1, column2 = __index_columns(index, [year1, year2])
+	swings = index["margin"][:, column2].astype(float) - index["margin"][:, column1].astype(float)
+	size = {"D": swings, "R": -swings, None: np.abs(swings)}[toward]
+	size = np.where(np.isnan(size), -np.inf, size)
+	
+	n = min(n, int(np.isfinite(size).sum()))
+	top = np.argpartition(-size, n - 1)[:n] if n > 0 else np.zeros(0, dtype=np.int64)
+	top = top[np.argsort(-size[top], kind="stable")]
+	results = pd.DataFrame(__index_rows(index, top))
+	results[str(year1) + " Margin"] = index["margin"][top, column1]
+	results[str(year2) + " Margin"] = index["margin"][top, column2]
+	results["Swing"] = swings[top]
 	return results
 
 
 # functions used with election_results
 
 
+# private method that writes a DataFrame to a new sheet of a write-only workbook, row by row. banners is a list of
+# (column, text) pairs written in a row above the header, and spacer is the position of an empty column to insert
+def __write_sheet(wb, title, results, banners=[], spacer=None):
+	import numpy as np
+	from openpyxl.cell import WriteOnlyCell
+	from openpyxl.styles import Font, Border, Side, Alignment
+	ws = wb.create_sheet(title)
+	columns = list(results.columns)
+	if not spacer is None:
+		columns.insert(spacer, None)
+		
+	if len(banners) > 0:
+		row = [None] * len(columns)
+		for (column, text) in banners:
+			row[column] = text
+		ws.append(row)
+		
+	# header cells are bold and bordered, like the headers written by DataFrame.to_excel
+	header = []
+	for column in columns:
+		cell = WriteOnlyCell(ws, value=column)
+		if not column is None:
+			cell.font = Font(bold=True)
+			cell.border = Border(left=Side(style="thin"), right=Side(style="thin"), top=Side(style="thin"), bottom=Side(style="thin"))
+			cell.alignment = Alignment(horizontal="center", vertical="top")
+		header.append(cell)
+	ws.append(header)
+	
+	# float32 percents are written with the two decimals shown on the atlas
+	rounded = {column: 2 for column in results.columns if results[column].dtype == np.float32}
+	if len(rounded) > 0:
+		results = results.astype({column: float for column in rounded}).round(rounded)
+		
+	for values in results.itertuples(index=False):
+		row = [None if isinstance(v, float) and np.isnan(v) else v for v in values] # missing values are left empty
+		if not spacer is None:
+			row.insert(spacer, None)
+		ws.append(row)
+		
+# private method that writes the results and swing of two elections to a new sheet, with the years above the columns of
+# each election and an empty column before the swing
+def __write_swing_sheet(wb, title, results1, results2, year1, year2):
+	results = __swings(results1, results2, year1, year2)
+	__write_sheet(wb, title, results, [(1, str(year1)), (len(results1.columns), str(year2))], len(results.columns) - 1)
+	
+# private method that writes sheets to file_name in a single streaming pass. sheets is a list of (loads, write) pairs,
+# where write takes in the workbook and the DataFrames for loads. each sheet is written as soon as its tables arrive from
+# iter_results, so memory stays bounded no matter how many sheets are written
+def __write_workbook(file_name, sheets):
+	import openpyxl
+	wb = openpyxl.Workbook(write_only=True)
+	tables = iter_results([load for (loads, _) in sheets for load in loads])
+	for (loads, write) in sheets:
+		results = [next(tables)[2] for _ in loads]
+		start = time.perf_counter()
+		write(wb, results)
+		if not __stats is None:
+			__stats.record("excel", loads[0][0], None, start, time.perf_counter() - start, \
+			{"rows": sum([len(r) for r in results]), "file": file_name})
+			
+	start = time.perf_counter()
+	wb.save(file_name)
+	if not __stats is None:
+		__stats.record("excel", None, None, start, time.perf_counter() - start, {"file": file_name, "bytes": os.path.getsize(file_name)})
+	__print("blue", "Success! " + file_name + " has been created.")
+	
+	
 # creates an excel sheet displaying the election data
 def create_simple_excel(state, year, file_name=None):
 	if file_name is None:
 		file_name = state + "_" + str(year) + "_Results.xlsx"
 		
-	results = election_results(state, year)
-	results.to_excel(file_name, index=False)
-	print(blue + "Success! " + file_name + " has been created." + res)
+	__write_workbook(file_name, [([(state, year)], lambda wb, results: __write_sheet(wb, "Sheet1", results[0]))])
 
 
 # creates an excel sheet displaying the election data for both elections and the swing between elections.
@@ -219,22 +1513,38 @@ def create_swing_excel(state, year1, year2, file_name=None):
 	if file_name is None:
 		file_name = state + "_" + str(year1) + "_to_" + str(year2) + "_Swing.xlsx"
 	
-	results1 = election_results(state, year1)
-	results = election_swings(state, year1, year2)
-	candidates = results.columns
+	__write_workbook(file_name, [([(state, year1), (state, year2)], \
+	lambda wb, results: __write_swing_sheet(wb, "Sheet1", results[0], results[1], year1, year2))])
 	
-	results.to_excel(file_name, index=False, startrow=1)
 	
-	wb = openpyxl.load_workbook(file_name)
-	ws = wb["Sheet1"]
-	cell1 = ws.cell(1,2)
-	cell2 = ws.cell(1, len(results1.columns) + 1)
-	cell1.value = str(year1)
-	cell2.value = str(year2)
-	ws.insert_cols(len(results.columns))
-	wb.save(file_name)
+# creates one excel file with a sheet of election data for every state and year. states and years can be lists or single values
+def create_results_workbook(states, years, file_name=None):
+	if not type(states) is list:
+		states = [states]
+	if not type(years) is list:
+		years = [years]
+	if file_name is None:
+		file_name = "_".join([str(year) for year in years]) + "_Results.xlsx"
+		
+	sheets = []
+	for state in states:
+		for year in years:
+			sheets.append(([(state, year)], lambda wb, results, title=state + " " + str(year): __write_sheet(wb, title, results[0])))
+	__write_workbook(file_name, sheets)
 	
-	print(blue + "Success! " + file_name + " has been created." + res)
+	
+# creates one excel file with a sheet of election data and swings between two elections for every state in states
+def create_swing_workbook(states, year1, year2, file_name=None):
+	if not type(states) is list:
+		states = [states]
+	if file_name is None:
+		file_name = str(year1) + "_to_" + str(year2) + "_Swing.xlsx"
+		
+	sheets = []
+	for state in states:
+		sheets.append(([(state, year1), (state, year2)], \
+		lambda wb, results, title=state: __write_swing_sheet(wb, title, results[0], results[1], year1, year2)))
+	__write_workbook(file_name, sheets)
 
 
 '''
@@ -254,9 +1564,64 @@ MapChart data format to be replicated
 '''
 
 
+# private method that gives each candidate in an election's results who has no color yet the next color in colors, in
+# the order they appear, and returns the names of those candidates
+def __assign_colors(results, color_map, colors):
+	new = []
+	for cand in results.columns[1:]:
+		if not cand[:-2] in color_map:
+			color_map[cand[:-2]] = colors[len(color_map)]
+			new.append(cand[:-2])
+	return new
+	
+# private method that builds a MapChart document and writes it to file_name. this is shared by every create_*_mapchart
+# function. results is an iterable of the DataFrames of results (single or multiple elections) for each state in states,
+# which are used one at a time as they arrive. classify takes in one DataFrame and returns the color of each county along
+# with a mask of the counties that can be colored. legend is the list of (color, label) pairs in legend order, which
+# classify may add to as new candidates appear. warning takes in a county and state that could not be colored and
+# returns the warning to show for it. returns the MapChart document as a dictionary, and if save is False nothing is
+# written or printed
+def __write_mapchart(file_name, title, legend, states, results, classify, warning, save=True):
+	paths = {} # MapChart path IDs of the counties in each color
+	warnings = ""
+	for (state, table) in zip(states, results): # iterate through all states
+		start = time.perf_counter()
+		keys = table.index
+		counties = list(table["County"])
+		colors, valid = classify(table)
+		if not __stats is None:
+			__stats.record("classify", state, None, start, time.perf_counter() - start, {"rows": len(table)})
+		for r in range(len(table)): # iterate through all rows
+			if valid[r]:
+				paths.setdefault(colors[r], []).append(mapchart_id(keys[r], counties[r], state))
+			else:
+				warnings += warning(counties[r], state)
+				
+	# place every color in the legend, leaving out the colors that no county received
+	groups = {}
+	for i in range(len(legend)):
+		groups[legend[i][0]] = {"div": "#box" + str(i), "label": legend[i][1], "paths": paths.get(legend[i][0], [])}
+	chart = {"groups": {color: group for (color, group) in groups.items() if len(group["paths"]) > 0}, "title": title, "hidden": [], \
+	"background": "#ffffff", "borders": "#000000", "legendFont": "Century Gothic", "legendFontColor": "#000000", "legendBgColor": "rgba (0, 0, 0, 0)"}
+	if not save:
+		return chart
+	
+	# create mapchart text file. the JSON is streamed to the file as it is encoded
+	start = time.perf_counter()
+	with open(file_name, "w", encoding="utf-8") as f:
+		json.dump(chart, f, ensure_ascii=False)
+	if not __stats is None:
+		__stats.record("mapchart", None, None, start, time.perf_counter() - start, {"file": file_name, "bytes": os.path.getsize(file_name)})
+		
+	__print("blue", "Success! " + file_name + " has been created.")
+	__print("orange", warnings, end="")
+	return chart
+	
+	
 # takes in a list of states (or a single state) and a year and produces a mapchart document for the election results
-# of that year in the given states
-def create_simple_mapchart(states, year, title=None, file_name=None, colors=[]):
+# of that year in the given states. every create_*_mapchart function also returns its document as a dictionary, and
+# with save=False only returns it, without writing a file or printing anything
+def create_simple_mapchart(states, year, title=None, file_name=None, colors=[], save=True):
 	if title is None:
 		title = str(year) + " Election"			
 	if file_name is None:
@@ -270,58 +1635,24 @@ def create_simple_mapchart(states, year, title=None, file_name=None, colors=[]):
 		for i in range(len(colors), 4):
 			colors.append(clist[i])
 		
-	results = [election_results(state, year) for state in states]
+	results = (table for (_, _, table) in iter_results([(state, year) for state in states]))
 	
-	all_candidates = {} # running list of all candidates in the country
-	for state in results:
-		for cand in state.columns[1:]:
-			all_candidates[cand[:-2]] = None
-	all_candidates = list(all_candidates.keys())
+	color_map = {} # color paths
+	legend = []
 	
-	chart = {"groups": {},"title":title,"hidden":[],"background":"#ffffff", "borders":"#000000","legendFont":"Century Gothic",\
-	"legendFontColor":"#000000","legendBgColor":"rgba (0, 0, 0, 0)"}
+	# color each county by its winner, placing candidates in the legend as they appear
+	def classify(table):
+		for cand in __assign_colors(table, color_map, colors):
+			legend.append((color_map[cand], cand))
+		names = table.columns[1:]
+		winners, _, ties = __winners(table)
+		return ([None if ties[r] else color_map[names[winners[r]][:-2]] for r in range(len(table))], ~ties)
+		
+	return __write_mapchart(file_name, title, legend, states, results, classify, \
+	lambda county, state: "Warning: " + county + ", " + abbs[state] + " was a tie.\n", save)
 	
-	color_map = {} # color paths
-	for i in range(len(all_candidates)): # place all candidates in the legend
-		color_map[all_candidates[i]] = colors[i]
-		chart["groups"][colors[i]] = {"div":"#box" + str(i),"label":all_candidates[i],"paths":[]}
-
-	# insert the data into the chart
-	warnings = "" # list of counties that are tied and thus will not be colored
-	for s in range(len(states)): # iterate through all states
-		for r in range(len(results[s])): # iterate through all rows
-			w,_ = __winner(results[s].loc[r])
-			if not w is None:
-				chart["groups"][color_map[w]]["paths"].append(results[s]["County"][r].replace(" ", "_").replace("'","_").replace(".","_").replace("-","_") + "__" + abbs[states[s]])
-			else:
-				warnings += "Warning: " + results[s]["County"][r] + ", " + abbs[states[s]] + " was a tie.\n"
-			
-	# clear candidates that did not win any counties
-	keys = []
-	for color in chart["groups"].keys():
-		if chart["groups"][color]["paths"] == []:
-			keys.append(color)
-			
-	for color in keys:
-		chart["groups"].pop(color)
-			
-	# create mapchart text file
-	with open(file_name, "w") as f:
-		ftext = str(chart).replace("'", '"') # mapchart text
-		# deal with exceptions and inconsistencies in how MapChart interprets text documents
-		ftext = ftext.replace("Lac_Qui", "Lac_qui").replace("_County_", "_Co__").replace("Baltimore_Co___MD", "Baltimore_County__MD")
-		ftext = ftext.replace("Baltimore__MD", "Baltimore_City__MD").replace("St__Mary_s__MD", "St_Mary_s__MD")
-		ftext = ftext.replace("Ste__Genevieve", "Sainte_Genevieve").replace("LaSalle", "La_Salle")
-		ftext = ftext.replace("Fairfax_City", "Fairfax").replace("Richmond_City", "Richmond").replace("Bedford_City", "Bedford")
-		ftext = ftext.replace("Franklin_City", "Franklin").replace("Roanoke_City", "Roanoke").replace("St__Louis_City", "St__Louis")
-		f.write(ftext)
-		f.close()
-		
-	print(blue + "Success! " + file_name + " has been created." + res)
-	print(orange + warnings + res, end="")
-	
-	
-def create_swing_mapchart(states, year1, year2, title=None, file_name=None, colors=[]):
+	
+def create_swing_mapchart(states, year1, year2, title=None, file_name=None, colors=[], save=True):
 	if title is None:
 		title = str(year1) + " > " + str(year2) + " Election Swings"			
 	if file_name is None:
@@ -340,56 +1671,22 @@ def create_swing_mapchart(states, year1, year2, title=None, file_name=None, colo
 			for j in range(len(colors[i]), 7):
 				colors[i].append(clist[i][j])
 
-	results = [election_swings(state, year1, year2) for state in states]
+	results = (table for (_, table) in iter_swings(states, year1, year2))
 	
-	chart = {"groups": {},"title":title,"hidden":[],"background":"#ffffff", "borders":"#000000","legendFont":"Century Gothic",\
-	"legendFontColor":"#000000","legendBgColor":"rgba (0, 0, 0, 0)"}
+	legend = [(colors[0][6], "D > 50"), (colors[0][5], "D > 40"), (colors[0][4], "D > 30"), (colors[0][3], "D > 20"), (colors[0][2], "D > 10"), \
+	(colors[0][1], "D > 5"), (colors[0][0], "D > 0"), (colors[2][0], "No Shift"), (colors[1][0], "R > 0"), (colors[1][1], "R > 5"), (colors[1][2], "R > 10"), \
+	(colors[1][3], "R > 20"), (colors[1][4], "R > 30"), (colors[1][5], "R > 40"), (colors[1][6], "R > 50")]
 	
-	all_swings = {"D > 50": colors[0][6], "D > 40": colors[0][5], "D > 30": colors[0][4], "D > 20": colors[0][3], "D > 10": colors[0][2], \
-	"D > 5": colors[0][1], "D > 0": colors[0][0], "No Shift": colors[2][0], "R > 0": colors[1][0], "R > 5": colors[1][1],"R > 10": colors[1][2], \
-	"R > 20": colors[1][3],"R > 30": colors[1][4],"R > 40": colors[1][5],"R > 50": colors[1][6]}
+	# color each county by the direction and size of its swing
+	def classify(table):
+		directions, levels, missing = __swing_levels(table)
+		return ([None if missing[r] else colors[directions[r]][levels[r]] for r in range(len(table))], ~missing)
+		
+	return __write_mapchart(file_name, title, legend, states, results, classify, \
+	lambda county, state: "Warning: No swing data collected for " + county + ", " + state + ".\n", save)
 	
-	box = 0
-	for k in all_swings.keys(): # place all swings in the legend
-		chart["groups"][all_swings[k]] = {"div":"#box" + str(box),"label":k,"paths":[]}
-		box += 1
-
-	# insert the data into the chart
-	warnings = "" # for missing data
-	for s in range(len(states)): # iterate through all states
-		for r in range(len(results[s])): # iterate through all rows
-			w,m = __swing(results[s].loc[r])
-			if not w is None:
-				chart["groups"][colors[w][m]]["paths"].append(results[s]["County"][r].replace(" ", "_").replace("'","_").replace(".","_").replace("-","_") + "__" + abbs[states[s]])
-			else:
-				warnings += "Warning: No swing data collected for " + results[s]["County"][r] + ", " + states[s] + ".\n"
-			
-	# clear swings that did not occur
-	keys = []
-	for color in chart["groups"].keys():
-		if chart["groups"][color]["paths"] == []:
-			keys.append(color)
-			
-	for color in keys:
-		chart["groups"].pop(color)
-			
-	# create mapchart text file
-	with open(file_name, "w") as f:
-		ftext = str(chart).replace("'", '"') # mapchart text
-		# deal with exceptions and inconsistencies in how MapChart interprets text documents
-		ftext = ftext.replace("Lac_Qui", "Lac_qui").replace("_County_", "_Co__").replace("Baltimore_Co___MD", "Baltimore_County__MD")
-		ftext = ftext.replace("Baltimore__MD", "Baltimore_City__MD").replace("St__Mary_s__MD", "St_Mary_s__MD")
-		ftext = ftext.replace("Ste__Genevieve", "Sainte_Genevieve").replace("LaSalle", "La_Salle")
-		ftext = ftext.replace("Fairfax_City", "Fairfax").replace("Richmond_City", "Richmond").replace("Bedford_City", "Bedford")
-		ftext = ftext.replace("Franklin_City", "Franklin").replace("Roanoke_City", "Roanoke").replace("St__Louis_City", "St__Louis")
-		f.write(ftext)
-		f.close()
-		
-	print(blue + "Success! " + file_name + " has been created." + res)
-	print(orange + warnings + res, end="")
-	
-	
-def create_margin_mapchart(states, year, title=None, file_name=None, colors=[]):
+	
+def create_margin_mapchart(states, year, title=None, file_name=None, colors=[], save=True):
 	if title is None:
 		title = str(year) + " Election"			
 	if file_name is None:
@@ -408,58 +1705,86 @@ def create_margin_mapchart(states, year, title=None, file_name=None, colors=[]):
 			for j in range(len(colors[i]), 4):
 				colors[i].append(clist[i][j])
 		
-	results = [election_results(state, year) for state in states]
+	results = (table for (_, _, table) in iter_results([(state, year) for state in states]))
 	
-	all_candidates = {} # running list of all candidates in the country
-	for state in results:
-		for cand in state.columns[1:]:
-			all_candidates[cand[:-2]] = None
-	all_candidates = list(all_candidates.keys())
+	color_map = {} # color paths
+	legend = []
 	
-	chart = {"groups": {},"title":title,"hidden":[],"background":"#ffffff", "borders":"#000000","legendFont":"Century Gothic",\
-	"legendFontColor":"#000000","legendBgColor":"rgba (0, 0, 0, 0)"}
+	# color each county by its winner and margin, placing candidates in the legend as they appear
+	def classify(table):
+		for cand in __assign_colors(table, color_map, colors):
+			shades = color_map[cand]
+			legend.extend([(shades[3], cand + " > 30%"), (shades[2], cand + " > 20%"), (shades[1], cand + " > 10%"), (shades[0], cand + " > 0%")])
+		names = table.columns[1:]
+		winners, _, levels, ties = __margins(table)
+		return ([None if ties[r] else color_map[names[winners[r]][:-2]][levels[r]] for r in range(len(table))], ~ties)
+		
+	return __write_mapchart(file_name, title, legend, states, results, classify, \
+	lambda county, state: "Warning: " + county + ", " + abbs[state] + " was a tie.\n", save)
 	
-	color_map = {} # color paths
-	j = 0
-	for i in range(len(all_candidates)): # place all candidates in the legend
-		color_map[all_candidates[i]] = colors[i]
-		chart["groups"][colors[i][3]] = {"div":"#box" + str(j),"label":all_candidates[i] + " > 30%","paths":[]}
-		chart["groups"][colors[i][2]] = {"div":"#box" + str(j+1),"label":all_candidates[i] + " > 20%","paths":[]}
-		chart["groups"][colors[i][1]] = {"div":"#box" + str(j+2),"label":all_candidates[i] + " > 10%","paths":[]}
-		chart["groups"][colors[i][0]] = {"div":"#box" + str(j+3),"label":all_candidates[i] + " > 0%","paths":[]}
-		j += 4
-
-	# insert the data into the chart
-	warnings = "" # list of counties that are tied and thus will not be colored
-	for s in range(len(states)): # iterate through all states
-		for r in range(len(results[s])): # iterate through all rows
-			w,m = __margin(results[s].loc[r])
-			if not w is None:
-				chart["groups"][color_map[w][m]]["paths"].append(results[s]["County"][r].replace(" ", "_").replace("'","_").replace(".","_").replace("-","_") + "__" + abbs[states[s]])
-			else:
-				warnings += "Warning: " + results[s]["County"][r] + ", " + abbs[states[s]] + " was a tie.\n"
-			
-	# clear candidates that did not win any counties
-	keys = []
-	for color in chart["groups"].keys():
-		if chart["groups"][color]["paths"] == []:
-			keys.append(color)
-			
-	for color in keys:
-		chart["groups"].pop(color)
-			
-	# create mapchart text file
-	with open(file_name, "w") as f:
-		ftext = str(chart).replace("'", '"') # mapchart text
-		# deal with exceptions and inconsistencies in how MapChart interprets text documents
-		ftext = ftext.replace("Lac_Qui", "Lac_qui").replace("_County_", "_Co__").replace("Baltimore_Co___MD", "Baltimore_County__MD")
-		ftext = ftext.replace("Baltimore__MD", "Baltimore_City__MD").replace("St__Mary_s__MD", "St_Mary_s__MD")
-		ftext = ftext.replace("Ste__Genevieve", "Sainte_Genevieve").replace("LaSalle", "La_Salle")
-		ftext = ftext.replace("Fairfax_City", "Fairfax").replace("Richmond_City", "Richmond").replace("Bedford_City", "Bedford")
-		ftext = ftext.replace("Franklin_City", "Franklin").replace("Roanoke_City", "Roanoke").replace("St__Louis_City", "St__Louis")
-		f.write(ftext)
-		f.close()
-		
-	print(blue + "Success! " + file_name + " has been created." + res)
-	print(orange + warnings + res, end="")
+	
+# the outputs that can be listed in a job spec, by the name of their create_ function
+__outputs = {"simple_excel": create_simple_excel, "swing_excel": create_swing_excel, "results_workbook": create_results_workbook, \
+"swing_workbook": create_swing_workbook, "simple_mapchart": create_simple_mapchart, "swing_mapchart": create_swing_mapchart, \
+"margin_mapchart": create_margin_mapchart}
 
+# private method that returns the (state, year) loads an output in a job spec needs
+def __job_loads(job):
+	states = job.get("states", job.get("state"))
+	if not type(states) is list:
+		states = [states]
+	if "years" in job:
+		years = job["years"]
+	elif "year" in job:
+		years = [job["year"]]
+	else:
+		years = [job["year1"], job["year2"]]
+	return [(state, year) for state in states for year in years]
+	
+# takes in a job spec, a list of outputs each given as a dictionary with "output" set to the name of a create_ function
+# without the prefix (such as "simple_mapchart") and the other keys set to its arguments, and returns the plan for
+# running them: the loads every output asks for, the unique loads among them and how many loads are saved
+def plan_jobs(jobs):
+	for job in jobs:
+		if not job.get("output") in __outputs:
+			raise ValueError("unknown output " + str(job.get("output")) + ", expected one of " + ", ".join(__outputs.keys()))
+	requested = [load for job in jobs for load in __job_loads(job)]
+	unique = list(dict.fromkeys(requested))
+	return {"outputs": len(jobs), "requested": len(requested), "unique": unique, "saved": len(requested) - len(unique)}
+	
+# private method that prints how many loads a plan saves
+def __print_plan(plan):
+	__print("blue", "Planned " + str(plan["outputs"]) + " outputs: " + str(plan["requested"]) + " loads requested, " + \
+	str(len(plan["unique"])) + " unique, " + str(plan["saved"]) + " saved.")
+	
+# produces every output in a job spec (see plan_jobs). each unique (state, year) is fetched and parsed once, in parallel,
+# and every output is then made from the same tables in memory. returns the plan
+def run_jobs(jobs):
+	global __batch_tables
+	plan = plan_jobs(jobs)
+	__print_plan(plan)
+	
+	__batch_tables = dict(zip(plan["unique"], __fetch_tables(plan["unique"])))
+	try:
+		for job in jobs:
+			__outputs[job["output"]](**{k: v for (k, v) in job.items() if k != "output"})
+	finally:
+		__batch_tables = None
+	return plan
+	
+	
+# runs a job spec from the command line: python ElectionScraper.py jobs.json, where jobs.json holds the list of outputs.
+# --plan prints the plan without fetching anything
+if __name__ == "__main__":
+	import sys
+	import ElectionScraper # run from the imported module, so that cached tables refer to its classes rather than __main__
+	args = [arg for arg in sys.argv[1:] if arg != "--plan"]
+	if len(args) != 1:
+		print("usage: python ElectionScraper.py [--plan] jobs.json")
+		sys.exit(2)
+	with open(args[0]) as f:
+		jobs = json.load(f)
+	if "--plan" in sys.argv:
+		ElectionScraper.__print_plan(ElectionScraper.plan_jobs(jobs))
+	else:
+		ElectionScraper.run_jobs(jobs)
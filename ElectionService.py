@@ -0,0 +1,222 @@
+'''
+This program runs the election scraper as a small local HTTP service, so that several programs can share one set of
+parsed elections. Tables are kept in an in-memory LRU shared by every request (see memory_size in ElectionScraper.py),
+concurrent requests for the same election wait for a single download instead of each fetching it, and many queries
+can be answered in one batched request.
+
+Every query is answered as JSON. states is a comma separated list of states, or "all", and years a comma separated list.
+	GET /results?states=Ohio,Iowa&years=2008,2012		county results of each state and year
+	GET /swings?states=Ohio&year1=2008&year2=2016		county swings between two elections in each state
+	GET /classify?states=Ohio&years=2008			winner, margin and margin level of each county
+	GET /mapchart?kind=simple&states=Ohio&year=2008		MapChart document (kind is simple, margin or swing,
+								which takes year1 and year2 instead of year)
+	POST /batch						a JSON list of queries, each a dictionary with "query"
+								set to results, swings, classify or mapchart and the
+								other keys set to its parameters. the elections of every
+								query are loaded together before any is answered
+
+Run with "python ElectionService.py" (--port, --host and --memory change the port, address and number of tables kept
+in memory).
+
+
+required modules: the modules required by ElectionScraper.py
+'''
+
+import argparse
+import json
+import threading
+import requests
+import ElectionScraper as es
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+flights = {} # (state, year) -> loads in progress, each a dictionary with an event set when the table or error is ready
+flight_lock = threading.Lock()
+
+# returns the DataFrames for each (state, year) pair in loads, in the same order. the pairs that no other request is
+# loading are fetched together in parallel, and the pairs another request is already loading are waited for
+def load_tables(loads):
+	mine = []
+	waits = []
+	with flight_lock:
+		for load in dict.fromkeys(loads):
+			if load in flights:
+				waits.append((load, flights[load]))
+			else:
+				flights[load] = {"event": threading.Event(), "table": None, "error": None}
+				mine.append(load)
+
+	tables = {}
+	error = None
+	try:
+		if len(mine) > 0:
+			tables = dict(zip(mine, es.fetch_results(mine)))
+	except Exception as e:
+		error = e
+		raise
+	finally:
+		with flight_lock:
+			for load in mine:
+				flight = flights.pop(load)
+				flight["table"] = tables.get(load)
+				flight["error"] = error
+				flight["event"].set()
+
+	for (load, flight) in waits:
+		flight["event"].wait()
+		if not flight["error"] is None:
+			raise flight["error"]
+		tables[load] = flight["table"]
+	return [tables[load] for load in loads]
+
+
+# returns the states of a query, given as a list or a comma separated string, or every state for "all"
+def query_states(query):
+	states = query.get("states", "all")
+	if not type(states) is list:
+		states = list(es.fips.keys()) if states == "all" else [state.strip() for state in states.split(",")]
+	for state in states:
+		if not state in es.fips:
+			raise ValueError("unknown state " + state)
+	return states
+
+# returns the list of years in a query parameter, given as a list, a number or a comma separated string
+def query_years(query, name):
+	if not name in query:
+		raise ValueError("missing parameter " + name)
+	years = query[name]
+	if type(years) is list:
+		return [int(year) for year in years]
+	return [int(year) for year in str(years).split(",")]
+
+# returns the (state, year) pairs a query needs
+def query_loads(query):
+	states = query_states(query)
+	if query.get("query") == "swings" or query.get("kind") == "swing":
+		years = query_years(query, "year1") + query_years(query, "year2")
+	elif query.get("query") == "mapchart":
+		years = query_years(query, "year")
+	else:
+		years = query_years(query, "years")
+	return [(state, year) for state in states for year in years]
+
+# returns the rows of a DataFrame, including its FIPS index, as JSON-ready dictionaries with missing values as None.
+# percents are given with the two decimals shown on the atlas
+def records(table):
+	return json.loads(table.reset_index().to_json(orient="records", double_precision=2))
+
+
+# answers one query (see the description at the top) and returns the response as a dictionary. the elections it needs
+# must already have been loaded by load_tables, so that they are taken from memory
+def answer(query, tables):
+	kind = query.get("query")
+	states = query_states(query)
+	if kind == "results":
+		return {"results": [{"state": state, "year": year, "counties": records(tables[(state, year)])} \
+		for state in states for year in query_years(query, "years")]}
+
+	if kind == "swings":
+		year1, year2 = query_years(query, "year1")[0], query_years(query, "year2")[0]
+		return {"swings": [{"state": state, "counties": records(es.results_swings(tables[(state, year1)], tables[(state, year2)], year1, year2))} \
+		for state in states]}
+
+	if kind == "classify":
+		return {"classify": [{"state": state, "year": year, "counties": records(es.classify_results(tables[(state, year)]))} \
+		for state in states for year in query_years(query, "years")]}
+
+	if kind == "mapchart":
+		chart = query.get("kind", "simple")
+		if not chart in ["simple", "margin", "swing"]:
+			raise ValueError("unknown MapChart kind " + str(chart) + ", expected simple, margin or swing")
+		if chart == "swing":
+			return es.create_swing_mapchart(states, query_years(query, "year1")[0], query_years(query, "year2")[0], \
+			title=query.get("title"), colors=[], save=False)
+		create = es.create_simple_mapchart if chart == "simple" else es.create_margin_mapchart
+		return create(states, query_years(query, "year")[0], title=query.get("title"), colors=[], save=False)
+
+	raise ValueError("unknown query " + str(kind) + ", expected results, swings, classify or mapchart")
+
+# answers a list of queries, loading the elections of all of them together first. a query with bad parameters is answered
+# with its error, and if the elections cannot be loaded the error is raised for the whole batch
+def answer_batch(queries):
+	if not type(queries) is list or not all([type(query) is dict for query in queries]):
+		raise ValueError("a batch must be a JSON list of queries, each a dictionary")
+	loads = []
+	for query in queries:
+		try:
+			loads += query_loads(query)
+		except (ValueError, TypeError):
+			pass # answered with its error below
+	unique = list(dict.fromkeys(loads))
+	tables = dict(zip(unique, load_tables(unique)))
+
+	responses = []
+	for query in queries:
+		try:
+			responses.append(answer(query, tables))
+		except (ValueError, TypeError, KeyError) as e:
+			responses.append({"error": str(e)})
+	return responses
+
+
+# request handler of the service
+class QueryHandler(BaseHTTPRequestHandler):
+	def do_GET(self):
+		url = urlparse(self.path)
+		query = {name: values[0] for (name, values) in parse_qs(url.query).items()}
+		query["query"] = url.path.strip("/")
+		self.respond(lambda: answer_batch([query])[0])
+
+	def do_POST(self):
+		if urlparse(self.path).path.strip("/") != "batch":
+			self.send_json(404, {"error": "unknown path " + self.path})
+			return
+		length = int(self.headers.get("Content-Length", 0))
+		self.respond(lambda: {"responses": answer_batch(json.loads(self.rfile.read(length)))})
+
+	# sends the response made by make, or the error it raised
+	def respond(self, make):
+		try:
+			response = make()
+		except (ValueError, TypeError, KeyError) as e:
+			self.send_json(400, {"error": str(e)})
+			return
+		except (requests.RequestException, LookupError) as e:
+			self.send_json(502, {"error": str(e)})
+			return
+		self.send_json(400 if "error" in response else 200, response)
+
+	def send_json(self, status, response):
+		body = json.dumps(response, ensure_ascii=False).encode("utf-8")
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json; charset=utf-8")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+
+# starts the service in a background thread and returns the server. memory is the number of tables kept in memory
+def start_service(host="127.0.0.1", port=8000, memory=256):
+	es.memory_size = memory
+	server = ThreadingHTTPServer((host, port), QueryHandler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Local HTTP query service for the election scraper")
+	parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+	parser.add_argument("--port", type=int, default=8000, help="port to listen on")
+	parser.add_argument("--memory", type=int, default=256, help="number of parsed tables kept in memory")
+	args = parser.parse_args()
+
+	es.memory_size = args.memory
+	server = ThreadingHTTPServer((args.host, args.port), QueryHandler)
+	print(es.blue + "Serving election queries on http://" + args.host + ":" + str(server.server_address[1]) + "/" + es.res)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		server.server_close()